@@ -0,0 +1,74 @@
+"""قياس زمن استخراج البيانات من صفحات HTML المحفوظة لكل محرك استخراج.
+
+الاستخدام:
+    python benchmarks/bench_extract.py [--repeat 50]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# (الصفحة، الدوال المستدعاة عليها في مسار المعالجة)
+CASES = [
+    ("episode.html", ["download_page_url"]),
+    ("quality.html", ["server_links"]),
+    ("r_page.html", ["button_href"]),
+    ("final.html", ["final_link", "file_meta"]),
+    # حالات خاصة: روابط داخل تعليقات HTML وعناصر فارغة تحمل data-quality
+    ("edge_comments.html", ["download_page_url", "server_links", "button_href", "final_link", "file_meta"]),
+    ("edge_void_quality.html", ["server_links"]),
+]
+
+
+def load_fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def run_case(backend, text: str, methods, repeat: int):
+    """تحليل الصفحة من جديد في كل تكرار كما يحدث مع كل طلب"""
+    result = None
+    started = time.perf_counter()
+    for _ in range(repeat):
+        page = bot.HtmlPage(text)
+        result = [getattr(backend, method)(page) for method in methods]
+    elapsed = (time.perf_counter() - started) / repeat
+    return elapsed * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    backends = [cls() for cls in bot.EXTRACTOR_BACKENDS.values()]
+    backends.append(bot.ExtractorChain(bot.HTML_EXTRACTORS.split(",")))
+
+    print(f"{'fixture':<24}" + "".join(f"{getattr(b, 'name', 'chain'):>12}" for b in backends))
+    mismatches = []
+    for fixture, methods in CASES:
+        text = load_fixture(fixture)
+        row = f"{fixture:<24}"
+        reference = None
+        for backend in backends:
+            ms, result = run_case(backend, text, methods, args.repeat)
+            row += f"{ms:>10.3f}ms"
+            if reference is None:
+                reference = result
+            elif result != reference:
+                mismatches.append((fixture, getattr(backend, "name", "chain"), result, reference))
+        print(row)
+
+    for fixture, name, result, reference in mismatches:
+        print(f"\n⚠️ {fixture}: {name} returned {result!r}\n   expected {reference!r}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
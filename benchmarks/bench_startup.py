@@ -0,0 +1,118 @@
+"""قياس زمن بدء التشغيل: استيراد البوت، وحفظ/استعادة لقطة الكاش، وأول طلب بعد إعادة التشغيل.
+
+- زمن `import bot` في عملية جديدة (الوسيط لعدة تشغيلات) مقارنة بالاستيراد المسبق
+  للوحدات الكسولة (bs4 و lxml.html و telegram.ext) كما كان سابقاً.
+- زمن كتابة وقراءة لقطة الكاش وحجمها لعدد محدد من المدخلات.
+- زمن أول طلب بعد استعادة اللقطة (يجب أن يُخدم من الكاش دون أي طلب شبكة).
+
+الاستخدام:
+    python benchmarks/bench_startup.py --runs 10 --entries 5000
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+LAZY_MODULES = ("bs4", "lxml.html", "telegram.ext")
+
+
+def import_time_ms(code: str, runs: int) -> float:
+    """الوسيط لزمن تشغيل عملية بايثون جديدة تنفذ الكود"""
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def loaded_after_import() -> list:
+    code = f"import sys, bot; print(' '.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True, capture_output=True, text=True)
+    return output.stdout.split()
+
+
+def fake_result(episode: int) -> dict:
+    return {
+        "success": True,
+        "title": f"مسلسل العنكبوت الحلقة {episode}",
+        "qualities": [
+            {"direct_link": f"https://s12.arabseed.example/files/ep{episode}-{quality}.mp4",
+             "file_name": f"ep{episode}-{quality}.mp4", "file_size": "1.20 GB", "quality": quality,
+             "checked_at": time.time()}
+            for quality in ("1080p", "720p", "480p")
+        ],
+    }
+
+
+async def snapshot_roundtrip(entries: int) -> dict:
+    import bot
+
+    path = os.path.join(tempfile.mkdtemp(), "cache.snapshot")
+    urls = [f"https://arabseed.example/مسلسل-العنكبوت-الحلقة-{n}" for n in range(1, entries + 1)]
+    for n, url in enumerate(urls, 1):
+        bot.resolution_cache.put(bot.canonical_episode_url(url), fake_result(n))
+        bot.redirect_cache.put(f"https://arabseed.example/l/{n}", (f"https://arabseed.example/go/{n}", 600), 600)
+
+    caches = [bot.resolution_cache, bot.redirect_cache]
+    started = time.perf_counter()
+    bot.write_cache_snapshot(path, [cache.snapshot(entries) for cache in caches])
+    write_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    restored = bot.read_cache_snapshot(path)
+    read_ms = (time.perf_counter() - started) * 1000
+
+    # محاكاة إعادة التشغيل: كاش فارغ ثم استعادة في الخلفية وأول طلب مباشرة
+    bot.resolution_cache = bot.ResolutionCache(bot.RESOLUTION_CACHE_SIZE, bot.RESOLUTION_CACHE_TTL)
+    bot.redirect_cache = bot.ResolutionCache(bot.REDIRECT_CACHE_SIZE, bot.REDIRECT_DEFAULT_TTL)
+    bot.cache_snapshot = bot.CacheSnapshot(path, [bot.resolution_cache, bot.redirect_cache], entries)
+    started = time.perf_counter()
+    await bot.cache_snapshot.start()
+    success, _, _ = await bot.resolve_cached(urls[-1], None)
+    first_request_ms = (time.perf_counter() - started) * 1000
+    hits = bot.resolution_cache.stats["hits"]
+    await bot.cache_snapshot.close()
+
+    return {
+        "entries": len(restored),
+        "snapshot_kb": round(os.path.getsize(path) / 1024, 1),
+        "write_ms": round(write_ms, 1),
+        "read_ms": round(read_ms, 1),
+        "first_request_ms": round(first_request_ms, 1),
+        "first_request_warm": bool(success and hits),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="عدد مرات قياس الاستيراد")
+    parser.add_argument("--entries", type=int, default=5000, help="عدد مدخلات كل كاش في اللقطة")
+    parser.add_argument("--json", metavar="PATH", help="إضافة النتيجة كسطر JSON إلى ملف للمقارنة")
+    args = parser.parse_args()
+
+    result = {
+        "python_ms": round(import_time_ms("pass", args.runs), 1),
+        "import_bot_ms": round(import_time_ms("import bot", args.runs), 1),
+        "import_bot_eager_ms": round(import_time_ms("import bot, " + ", ".join(LAZY_MODULES), args.runs), 1),
+        "lazy_loaded_at_import": loaded_after_import(),
+    }
+    result.update(asyncio.run(snapshot_roundtrip(args.entries)))
+
+    for key, value in result.items():
+        print(f"{key:<24}{value}")
+    if args.json:
+        with open(args.json, "a", encoding="utf-8") as f:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
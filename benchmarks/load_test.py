@@ -0,0 +1,195 @@
+"""اختبار حمل للبوت مقابل الموقع الوهمي المحلي.
+
+يشغّل mock_site في عملية منفصلة ثم يستدعي process_arabseed_url (أو handle_message
+بتحديثات Telegram وهمية) بتوازٍ محدد، ويطبع معدل الإنجاز وزمن p50/p95/p99
+واستهلاك الذاكرة لمقارنة التغييرات بين التشغيلات.
+
+الاستخدام:
+    python benchmarks/load_test.py --requests 200 --concurrency 20 --latency 30
+    python benchmarks/load_test.py --target handler --json results.jsonl
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import socket
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import bot  # noqa: E402
+import mock_site  # noqa: E402
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class FakeMessage:
+    """رسالة Telegram وهمية تسجل الردود بدلاً من إرسالها"""
+
+    def __init__(self, text: str = "", done: asyncio.Event = None):
+        self.text = text
+        self.done = done
+        self.replies = []
+
+    async def reply_text(self, text, reply_markup=None, parse_mode=None, **kwargs):
+        self.replies.append((text, reply_markup))
+        self._check_done(text)
+        return FakeMessage(text, self.done)
+
+    async def edit_text(self, text, **kwargs):
+        self.text = text
+        self._check_done(text)
+        return self
+
+    def _check_done(self, text: str):
+        # أي رد غير رسائل الانتظار (بما فيها رسالة "مشغول") يعني انتهاء المعالجة
+        if self.done is not None and not text.startswith("⏳"):
+            self.done.set()
+
+    async def delete(self):
+        return True
+
+
+def fake_update(user_id: int, text: str, done: asyncio.Event) -> SimpleNamespace:
+    message = FakeMessage(text, done)
+    user = SimpleNamespace(id=user_id, first_name=f"user{user_id}")
+    return SimpleNamespace(effective_user=user, message=message, effective_message=message,
+                           effective_chat=SimpleNamespace(id=user_id))
+
+
+async def run_process(url: str) -> bool:
+    if bot.resolver_pool.started:
+        return (await bot.resolver_pool.resolve(url))["success"]
+    success, _, _ = await bot.process_arabseed_url(url, bot.http_client.session)
+    return success
+
+
+async def run_handler(url: str, user_id: int) -> bool:
+    done = asyncio.Event()
+    update = fake_update(user_id, url, done)
+    context = SimpleNamespace(args=[], bot=None, application=None, user_data={}, chat_data={})
+    await bot.handle_message(update, context)
+    await done.wait()
+    return any(markup is not None for _, markup in update.message.replies)
+
+
+async def drive(args: argparse.Namespace, base: str) -> dict:
+    await bot.http_client.start()
+    if args.workers:
+        bot.resolver_pool.size = args.workers
+        await bot.resolver_pool.start()
+    latencies = []
+    failures = 0
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(args.requests):
+        queue.put_nowait(i)
+
+    async def worker():
+        nonlocal failures
+        while True:
+            try:
+                i = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            url = base + mock_site.episode_path(i % args.distinct + 1)
+            started = time.perf_counter()
+            try:
+                if args.target == "handler":
+                    ok = await run_handler(url, user_id=i)
+                else:
+                    ok = await run_process(url)
+            except Exception:
+                ok = False
+            latencies.append(time.perf_counter() - started)
+            failures += not ok
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    await bot.resolver_pool.close()
+    http_stats = bot.resolver_pool.combined_stats("http", bot.http_client.stats)
+    await bot.http_client.close()
+
+    return {
+        "target": args.target,
+        "workers": args.workers,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "latency_ms": args.latency,
+        "error_rate": args.error_rate,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(args.requests / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "failures": failures,
+        "connections_created": http_stats["connections_created"],
+        "connections_reused": http_stats["connections_reused"],
+        "stage_p95_ms": {stage: round(h.percentile(95) * 1000, 1) for stage, h in sorted(bot.metrics.by_stage().items())},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=("process", "handler"), default="process")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--distinct", type=int, default=0, help="عدد الحلقات المختلفة (الافتراضي: كل طلب حلقة مختلفة)")
+    parser.add_argument("--workers", type=int, default=0, help="عدد عمليات الاستخراج المنفصلة (0 = داخل العملية)")
+    parser.add_argument("--site-processes", type=int, default=1, help="عدد عمليات الموقع الوهمي")
+    parser.add_argument("--tracemalloc", action="store_true", help="قياس ذروة الذاكرة المخصصة في بايثون (أبطأ)")
+    parser.add_argument("--json", metavar="PATH", help="إضافة النتيجة كسطر JSON إلى ملف للمقارنة")
+    mock_site.add_arguments(parser)
+    args = parser.parse_args()
+    args.distinct = args.distinct or args.requests
+
+    port = free_port()
+    ctx = multiprocessing.get_context("spawn")
+    sites = []
+    for _ in range(args.site_processes):
+        ready = ctx.Event()
+        site = ctx.Process(target=mock_site.serve, args=(args, port, ready), daemon=True)
+        site.start()
+        ready.wait(10)
+        sites.append(site)
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    try:
+        result = asyncio.run(drive(args, f"http://127.0.0.1:{port}"))
+    finally:
+        for site in sites:
+            site.terminate()
+
+    result["max_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    if args.tracemalloc:
+        result["py_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+
+    for key, value in result.items():
+        print(f"{key:<22}{value}")
+    if args.json:
+        with open(args.json, "a", encoding="utf-8") as f:
+            f.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
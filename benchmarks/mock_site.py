@@ -0,0 +1,182 @@
+"""موقع عرب سيد وهمي محلي لاختبارات الأداء دون الاتصال بالموقع الحقيقي.
+
+يعيد إنتاج السلسلة الكاملة:
+    /l/<code>                      رابط مختصر -> تحويلات 30x
+    /<slug-الحلقة-N>               صفحة الحلقة (رابط /download/)
+    /download/<slug>/              صفحة الجودات (data-quality + روابط /l/)
+    /go/<code>                     صفحة السيرفر (رابط category/downloadz/?r=)
+    /category/downloadz/?r=<id>    صفحة a#btn
+    /download-file/?r=<id>         الصفحة النهائية (a#btn + .TitleCenteral)
+    /files/<name>.mp4              الملف المباشر (HEAD / Range)
+
+الاستخدام:
+    python benchmarks/mock_site.py --port 8080 --latency 50 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import os
+import random
+import re
+import zlib
+from typing import Optional
+from urllib.parse import quote, unquote
+
+from aiohttp import web
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+FIXTURE_HOSTS = ("https://s12.arabseed.example", "https://arabseed.example")
+EPISODE_SLUG = "مسلسل-العنكبوت-الحلقة-{}"
+FILE_SIZE = 1288490188
+
+NOT_FOUND_PAGE = """<!DOCTYPE html>
+<html lang="ar" dir="rtl"><head><meta charset="utf-8"><title>404</title></head>
+<body><div class="NotFound"><h1>لم يتم العثور على الصفحة المطلوبة</h1></div></body></html>
+"""
+
+
+def episode_path(episode: int) -> str:
+    return "/" + quote(EPISODE_SLUG.format(episode))
+
+
+class MockSite:
+    """إعدادات الموقع الوهمي (زمن الاستجابة، نسبة الأخطاء، حجم الصفحات)"""
+
+    def __init__(self, latency_ms: float = 0, jitter: float = 0.2, error_rate: float = 0.0,
+                 page_padding: int = 0, redirect_hops: int = 2, episodes: int = 10000,
+                 dead_link_rate: float = 0.0, seed: Optional[int] = None):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.page_padding = page_padding
+        self.redirect_hops = redirect_hops
+        self.episodes = episodes
+        self.dead_link_rate = dead_link_rate
+        self.random = random.Random(seed)
+        self.hits = 0
+        self.fixtures = {}
+        for name in ("episode", "quality", "server", "r_page", "final"):
+            with open(os.path.join(FIXTURES_DIR, f"{name}.html"), encoding="utf-8") as f:
+                self.fixtures[name] = f.read()
+
+    def render(self, request: web.Request, name: str, episode: Optional[int] = None) -> web.Response:
+        base = f"{request.scheme}://{request.host}"
+        body = self.fixtures[name]
+        for host in FIXTURE_HOSTS:
+            body = body.replace(host, base)
+        if episode is not None:
+            body = body.replace("%d8%a7%d9%84%d8%ad%d9%84%d9%82%d8%a9-12/", f"%d8%a7%d9%84%d8%ad%d9%84%d9%82%d8%a9-{episode}/")
+            body = body.replace("الحلقة 12", f"الحلقة {episode}").replace("EP12", f"EP{episode}")
+        if self.page_padding:
+            # حشو في نهاية الصفحة لمحاكاة الصفحات الكبيرة
+            body = body.replace("</body>", f"<!-- {'x' * self.page_padding} -->\n</body>")
+        return web.Response(text=body, content_type="text/html")
+
+    @web.middleware
+    async def middleware(self, request: web.Request, handler):
+        self.hits += 1
+        if self.latency:
+            await asyncio.sleep(self.latency * self.random.uniform(1 - self.jitter, 1 + self.jitter))
+        if self.error_rate and self.random.random() < self.error_rate:
+            return web.Response(status=503, text="Service Unavailable")
+        response = await handler(request)
+        # ETag للصفحات لاختبار الطلبات الشرطية
+        if request.method == "GET" and response.status == 200 and isinstance(response.body, bytes):
+            response.etag = format(zlib.crc32(response.body), "x")
+            if request.if_none_match and any(etag.value == response.etag.value for etag in request.if_none_match):
+                return web.Response(status=304, headers={"ETag": response.headers["ETag"]})
+        return response
+
+    async def episode(self, request: web.Request) -> web.Response:
+        match = re.search(r"-(\d+)/?$", unquote(request.path))
+        if not match:
+            raise web.HTTPNotFound()
+        episode = int(match.group(1))
+        if episode > self.episodes:
+            return web.Response(text=NOT_FOUND_PAGE, content_type="text/html")
+        return self.render(request, "episode", episode)
+
+    async def quality(self, request: web.Request) -> web.Response:
+        match = re.search(r"-(\d+)/?$", unquote(request.path))
+        return self.render(request, "quality", int(match.group(1)) if match else None)
+
+    async def shortlink(self, request: web.Request) -> web.Response:
+        code = request.match_info["code"]
+        hop = int(request.query.get("hop", "0"))
+        if hop < self.redirect_hops:
+            # تحويل نسبي لاختبار حل Location بالنسبة للخطوة الحالية
+            raise web.HTTPFound(f"/l/{code}?hop={hop + 1}")
+        raise web.HTTPMovedPermanently(f"/go/{code}")
+
+    async def server(self, request: web.Request) -> web.Response:
+        return self.render(request, "server")
+
+    async def r_page(self, request: web.Request) -> web.Response:
+        return self.render(request, "r_page")
+
+    async def final(self, request: web.Request) -> web.Response:
+        return self.render(request, "final")
+
+    async def file(self, request: web.Request) -> web.Response:
+        if self.dead_link_rate and self.random.random() < self.dead_link_rate:
+            raise web.HTTPNotFound()
+        headers = {"Accept-Ranges": "bytes", "Content-Type": "video/mp4"}
+        if request.method == "HEAD":
+            headers["Content-Length"] = str(FILE_SIZE)
+            return web.Response(status=200, headers=headers)
+        if request.headers.get("Range") == "bytes=0-0":
+            headers["Content-Range"] = f"bytes 0-0/{FILE_SIZE}"
+            return web.Response(status=206, body=b"\0", headers=headers)
+        return web.Response(status=200, body=b"\0" * 1024, headers=headers)
+
+    def make_app(self) -> web.Application:
+        app = web.Application(middlewares=[self.middleware])
+        app.router.add_get("/l/{code}", self.shortlink)
+        app.router.add_get("/go/{code}", self.server)
+        app.router.add_get("/download/{slug}/", self.quality)
+        app.router.add_get("/category/downloadz/", self.r_page)
+        app.router.add_get("/download-file/", self.final)
+        app.router.add_route("*", "/files/{name}", self.file)
+        app.router.add_get("/{slug}", self.episode)
+        return app
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency", type=float, default=20, help="زمن الاستجابة لكل طلب (ms)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="نسبة الطلبات التي تعيد 503")
+    parser.add_argument("--page-padding", type=int, default=0, help="حجم الحشو المضاف لكل صفحة (بايت)")
+    parser.add_argument("--redirect-hops", type=int, default=2)
+    parser.add_argument("--episodes", type=int, default=10000, help="آخر حلقة موجودة")
+    parser.add_argument("--dead-link-rate", type=float, default=0.0, help="نسبة الروابط المباشرة التي تعيد 404")
+
+
+def site_from_args(args: argparse.Namespace) -> MockSite:
+    return MockSite(latency_ms=args.latency, error_rate=args.error_rate, page_padding=args.page_padding,
+                    redirect_hops=args.redirect_hops, episodes=args.episodes,
+                    dead_link_rate=args.dead_link_rate)
+
+
+def serve(args: argparse.Namespace, port: int, ready=None):
+    """تشغيل الموقع الوهمي (يُستدعى أيضاً في عملية منفصلة من load_test)"""
+    async def run():
+        runner = web.AppRunner(site_from_args(args).make_app(), access_log=None)
+        await runner.setup()
+        # reuse_port يسمح بتشغيل عدة عمليات على نفس المنفذ
+        await web.TCPSite(runner, "127.0.0.1", port, reuse_port=True).start()
+        if ready is not None:
+            ready.set()
+        await asyncio.Event().wait()
+
+    asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8080)
+    add_arguments(parser)
+    args = parser.parse_args()
+    print(f"Mock arabseed site on http://127.0.0.1:{args.port}{episode_path(1)}")
+    serve(args, args.port)
+
+
+if __name__ == "__main__":
+    main()
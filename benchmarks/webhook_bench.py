@@ -0,0 +1,279 @@
+"""قياس زمن التحديث حتى الرد (Webhook مقابل Polling) دون اتصال بالإنترنت.
+
+يشغّل خادم Bot API وهمياً (عبر BOT_API_BASE_URL) والموقع الوهمي، ثم يرسل تحديثات
+Telegram مصطنعة: في وضع webhook كطلبات POST إلى خادم البوت المدمج، وفي وضع polling
+عبر getUpdates من الخادم الوهمي. الزمن يُقاس من إرسال التحديث حتى وصول الرد النهائي
+(أول رسالة لا تبدأ بـ "⏳") إلى الخادم الوهمي.
+
+الاستخدام:
+    python benchmarks/webhook_bench.py --mode webhook --requests 200 --concurrency 20
+    python benchmarks/webhook_bench.py --mode polling --text start
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from aiohttp import ClientSession, web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import mock_site  # noqa: E402
+
+BENCH_TOKEN = "123456:bench"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class MockBotApi:
+    """خادم Bot API وهمي يسجل الردود ويقدم التحديثات عبر getUpdates"""
+
+    def __init__(self):
+        self.updates: List[dict] = []
+        self.new_update = asyncio.Condition()
+        self.replies: Dict[int, asyncio.Future] = {}
+        self.calls: Dict[str, int] = {}
+        self.message_ids = 0
+
+    def expect_reply(self, chat_id: int) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self.replies[chat_id] = future
+        return future
+
+    async def push_update(self, update: dict):
+        async with self.new_update:
+            self.updates.append(update)
+            self.new_update.notify_all()
+
+    async def get_updates(self, params: dict) -> list:
+        offset = int(params.get("offset") or 0)
+        timeout = float(params.get("timeout") or 0)
+
+        def pending() -> list:
+            return [update for update in self.updates if update["update_id"] >= offset]
+
+        async with self.new_update:
+            if not pending() and timeout:
+                try:
+                    await asyncio.wait_for(self.new_update.wait_for(lambda: bool(pending())), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            result = pending()
+        # التحديثات المؤكدة (أقل من offset) لا حاجة لإبقائها
+        self.updates = result
+        return result
+
+    def message(self, params: dict) -> dict:
+        self.message_ids += 1
+        chat_id = int(params["chat_id"])
+        text = params.get("text", "")
+        if not text.startswith("⏳"):
+            future = self.replies.pop(chat_id, None)
+            if future is not None and not future.done():
+                future.set_result(time.perf_counter())
+        return {"message_id": self.message_ids, "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"}, "text": text}
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+
+        if method == "getMe":
+            result = {"id": 123456, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        elif method == "getUpdates":
+            result = await self.get_updates(params)
+        elif method in ("sendMessage", "editMessageText"):
+            result = self.message(params)
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+
+def make_update(update_id: int, chat_id: int, text: str) -> dict:
+    user = {"id": chat_id, "is_bot": False, "first_name": f"user{chat_id}"}
+    message = {"message_id": update_id, "date": int(time.time()), "chat": {"id": chat_id, "type": "private"},
+               "from": user, "text": text}
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": update_id, "message": message}
+
+
+async def wait_for_port(port: int, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.05)
+
+
+async def drive(args: argparse.Namespace, api: MockBotApi, site_base: str) -> dict:
+    import bot
+
+    # سجل httpx يطبع كل طلب إلى Bot API الوهمي
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    application = bot.build_application()
+    stop = asyncio.Event()
+    if args.mode == "webhook":
+        server = asyncio.create_task(bot.serve_webhook(application, stop))
+        await wait_for_port(bot.WEBHOOK_PORT)
+    else:
+        await application.initialize()
+        await application.post_init(application)
+        await application.start()
+        await application.updater.start_polling(poll_interval=0, timeout=10,
+                                                allowed_updates=bot.allowed_updates_for(application))
+
+    webhook_url = f"http://127.0.0.1:{bot.WEBHOOK_PORT}{bot.WEBHOOK_PATH}"
+    headers = {"X-Telegram-Bot-Api-Secret-Token": bot.WEBHOOK_SECRET}
+    latencies, acks = [], []
+    failures = 0
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(args.requests):
+        queue.put_nowait(i)
+
+    async with ClientSession() as client:
+        async def send(update: dict):
+            if args.mode == "webhook":
+                started = time.perf_counter()
+                async with client.post(webhook_url, json=update, headers=headers) as response:
+                    response.raise_for_status()
+                acks.append(time.perf_counter() - started)
+            else:
+                await api.push_update(update)
+
+        async def worker():
+            nonlocal failures
+            while True:
+                try:
+                    i = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                chat_id = 1000 + i
+                text = "/start" if args.text == "start" else site_base + mock_site.episode_path(i % args.distinct + 1)
+                replied = api.expect_reply(chat_id)
+                started = time.perf_counter()
+                try:
+                    await send(make_update(i + 1, chat_id, text))
+                    latencies.append(await asyncio.wait_for(replied, args.timeout) - started)
+                except Exception:
+                    failures += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    if args.mode == "webhook":
+        stop.set()
+        await server
+    else:
+        await application.updater.stop()
+        await application.stop()
+        await application.post_stop(application)
+        await application.shutdown()
+        await application.post_shutdown(application)
+
+    return {
+        "mode": args.mode,
+        "text": args.text,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(args.requests / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "ack_p95_ms": round(percentile(acks, 95) * 1000, 1),
+        "failures": failures,
+        "api_calls": dict(sorted(api.calls.items())),
+    }
+
+
+async def run(args: argparse.Namespace, site_base: str) -> dict:
+    api = MockBotApi()
+    runner = web.AppRunner(api.make_app(), access_log=None)
+    await runner.setup()
+    api_port = free_port()
+    await web.TCPSite(runner, "127.0.0.1", api_port).start()
+
+    # إعدادات البوت تُقرأ عند الاستيراد لذا تُضبط قبله
+    os.environ.update({
+        "TELEGRAM_BOT_TOKEN": BENCH_TOKEN,
+        "BOT_API_BASE_URL": f"http://127.0.0.1:{api_port}/bot",
+        "WEBHOOK_PORT": str(free_port()),
+        "WEBHOOK_URL": "",
+        "METRICS_PORT": "0",
+        "SESSION_DB_PATH": os.path.join(tempfile.mkdtemp(), "bench-sessions.db"),
+    })
+    try:
+        return await drive(args, api, site_base)
+    finally:
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=("webhook", "polling"), default="webhook")
+    parser.add_argument("--text", choices=("url", "start"), default="url",
+                        help="url = استخراج كامل من الموقع الوهمي، start = زمن التوجيه فقط")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--distinct", type=int, default=0, help="عدد الحلقات المختلفة (الافتراضي: كل طلب حلقة مختلفة)")
+    parser.add_argument("--timeout", type=float, default=60, help="أقصى انتظار للرد (ثانية)")
+    parser.add_argument("--json", metavar="PATH", help="إضافة النتيجة كسطر JSON إلى ملف للمقارنة")
+    mock_site.add_arguments(parser)
+    args = parser.parse_args()
+    args.distinct = args.distinct or args.requests
+
+    port = free_port()
+    ready = multiprocessing.get_context("spawn").Event()
+    site = multiprocessing.get_context("spawn").Process(target=mock_site.serve, args=(args, port, ready), daemon=True)
+    site.start()
+    ready.wait(10)
+    try:
+        result = asyncio.run(run(args, f"http://127.0.0.1:{port}"))
+    finally:
+        site.terminate()
+
+    for key, value in result.items():
+        print(f"{key:<18}{value}")
+    if args.json:
+        with open(args.json, "a", encoding="utf-8") as f:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,5 @@
+from __future__ import annotations
+
 import os
 import json
 import re
@@ -5,355 +7,3072 @@ import time
 import logging
 import asyncio
 import traceback
+import html
+import bisect
+import codecs
+import sqlite3
+import tempfile
+import multiprocessing
+import signal
+import hashlib
+import hmac
+import threading
+import random
+import mmap
+import struct
+import contextvars
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Dict, List, Optional, Tuple
-from urllib.parse import urlparse, unquote, urlunparse, quote
+from collections import OrderedDict, deque
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse, unquote, urlunparse, quote, urljoin
 
 import aiohttp
-import requests
-from bs4 import BeautifulSoup
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import (
-    Application,
-    CommandHandler,
-    MessageHandler,
-    CallbackQueryHandler,
-    filters,
-    ContextTypes,
+from aiohttp import web
+# lxml و bs4 و telegram.ext تُستورد عند الحاجة فقط لتسريع بدء التشغيل وعمليات الاستخراج
+from telegram import (
+    Update,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    InlineQueryResultArticle,
+    InputTextMessageContent,
+)
+from telegram.error import Forbidden, NetworkError, RetryAfter, TelegramError
+
+if TYPE_CHECKING:
+    # للتلميحات فقط (الاستيراد الفعلي كسول)
+    from bs4 import BeautifulSoup
+    from telegram.ext import Application, ContextTypes
+
+# ----------------- إعدادات التسجيل (Logging) -----------------
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
 )
+logger = logging.getLogger(__name__)
+
+# ----------------- إعدادات البوت -----------------
+TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN", "YOUR_BOT_TOKEN_HERE")
+# خادم Bot API بديل (خادم محلي أو خادم وهمي للاختبارات)
+BOT_API_BASE_URL = os.environ.get("BOT_API_BASE_URL", "")
+ADMIN_IDS = json.loads(os.environ.get("ADMIN_IDS", "[]"))
+MAX_EPISODES_PER_RUN = 50
+RANGE_WORKERS = int(os.environ.get("RANGE_WORKERS", "3"))
+RANGE_NOT_FOUND_STREAK = int(os.environ.get("RANGE_NOT_FOUND_STREAK", "3"))
+# الفاصل بين رسائل /range في نفس المحادثة (حد Telegram حوالي رسالة في الثانية لكل محادثة)
+RANGE_SEND_INTERVAL = float(os.environ.get("RANGE_SEND_INTERVAL", "1.0"))
+RANGE_SEND_RETRIES = 3
+REQUEST_TIMEOUT = 30  # الحد الأعلى لأي طلب HTTP (المهلة الفعلية لكل مرحلة متكيفة)
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+
+# استخراج الجودات بالتوازي
+RESOLVE_CONCURRENTLY = os.environ.get("RESOLVE_CONCURRENTLY", "1") == "1"
+QUALITY_CONCURRENCY = int(os.environ.get("QUALITY_CONCURRENCY", "4"))
+
+# ميزانية زمنية واحدة لكل طلب تُقسَّم على المراحل، ومهل متكيفة حسب الزمن الملاحظ
+REQUEST_BUDGET = float(os.environ.get("REQUEST_BUDGET", "45"))
+REPLY_RESERVE = 1.0
+STAGE_TIMEOUT_MIN = 2.0
+STAGE_TIMEOUT_MAX = float(os.environ.get("STAGE_TIMEOUT_MAX", "20"))
+STAGE_TIMEOUT_FACTOR = 3.0
+STAGE_TIMEOUT_MIN_SAMPLES = 20
+STAGE_TIMEOUT_REFRESH = 5.0
+RETRY_ATTEMPTS = int(os.environ.get("RETRY_ATTEMPTS", "2"))
+RETRY_BASE_DELAY = 0.25
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# عمليات الاستخراج المنفصلة (0 = داخل العملية الرئيسية)
+# مقاييس المراحل والعدادات تصل من العمال مع كل نتيجة، وكل عامل يحفظ لقطة كاش التحويلات الخاصة به
+RESOLVER_WORKERS = int(os.environ.get("RESOLVER_WORKERS", "0"))
+RESOLVER_SOCKET_DIR = os.environ.get("RESOLVER_SOCKET_DIR", tempfile.gettempdir())
+RESOLVER_START_TIMEOUT = 15.0
+# أقصى انتظار بين محاولات إعادة تشغيل عامل متعطل (يتضاعف من نصف ثانية)
+RESOLVER_RESTART_MAX_DELAY = 30.0
+
+# جدولة المهام
+SCHEDULER_WORKERS = int(os.environ.get("SCHEDULER_WORKERS", "8"))
+SCHEDULER_MAX_QUEUE = int(os.environ.get("SCHEDULER_MAX_QUEUE", "200"))
+SCHEDULER_MAX_PER_USER = int(os.environ.get("SCHEDULER_MAX_PER_USER", "5"))
+QUEUE_POSITION_UPDATE_INTERVAL = 3.0
+
+# الجلب المسبق للحلقة التالية (لمن فعّل /auto) كمهام خلفية منخفضة الأولوية
+PREFETCH_NEXT = os.environ.get("PREFETCH_NEXT", "1") == "1"
+PREFETCH_MAX_INFLIGHT = int(os.environ.get("PREFETCH_MAX_INFLIGHT", "2"))
+PREFETCH_PER_MINUTE = float(os.environ.get("PREFETCH_PER_MINUTE", "20"))
+# لا جلب مسبق إذا تجاوز الحمل (الجارية + المنتظرة) / العمال هذه النسبة
+PREFETCH_MAX_LOAD = 0.5
+PREFETCH_MISS_TTL = 3600
+
+# متابعة الحلقات الجديدة (/watch): فحص شرطي واحد لكل مسلسل كل WATCH_INTERVAL
+WATCH_INTERVAL = float(os.environ.get("WATCH_INTERVAL", "1800"))
+WATCH_RETRY_INTERVAL = 300
+WATCH_JITTER = 0.2
+WATCH_TICK = 30
+WATCH_BATCH = 200
+WATCH_CONCURRENCY = int(os.environ.get("WATCH_CONCURRENCY", "4"))
+WATCH_MAX_PER_USER = 20
+WATCH_NOTIFY_DELAY = 0.05
+
+# لقطة كاش الروابط والتحويلات على القرص لإعادة التشغيل دافئاً ("" = تعطيل، {instance} = INSTANCE_ID)
+CACHE_SNAPSHOT_PATH = os.environ.get("CACHE_SNAPSHOT_PATH", "cache-{instance}.snapshot")
+CACHE_SNAPSHOT_MAX_ENTRIES = int(os.environ.get("CACHE_SNAPSHOT_MAX_ENTRIES", "5000"))
+CACHE_SNAPSHOT_INTERVAL = 300
+CACHE_SNAPSHOT_LOAD_WAIT = 1.0
+
+# الاستعلام المضمّن: Telegram ينتظر الإجابة ثوانٍ قليلة فقط
+INLINE_WAIT = float(os.environ.get("INLINE_WAIT", "2.5"))
+INLINE_CACHE_TIME = int(os.environ.get("INLINE_CACHE_TIME", "300"))
+INLINE_FAILURE_CACHE_TIME = 30
+
+# جلسات المستخدمين
+SESSION_DB_PATH = os.environ.get("SESSION_DB_PATH", "sessions.db")
+SESSION_MAX_USERS = int(os.environ.get("SESSION_MAX_USERS", "10000"))
+SESSION_IDLE_TTL = float(os.environ.get("SESSION_IDLE_TTL", str(6 * 3600)))
+SESSION_HISTORY_SIZE = int(os.environ.get("SESSION_HISTORY_SIZE", "20"))
+SESSION_FLUSH_INTERVAL = float(os.environ.get("SESSION_FLUSH_INTERVAL", "5"))
+ACTIVE_USERS_WINDOW = 24 * 3600
+
+# إعدادات مجمع الاتصالات
+HTTP_POOL_LIMIT = int(os.environ.get("HTTP_POOL_LIMIT", "100"))
+HTTP_POOL_LIMIT_PER_HOST = int(os.environ.get("HTTP_POOL_LIMIT_PER_HOST", "20"))
+HTTP_DNS_CACHE_TTL = int(os.environ.get("HTTP_DNS_CACHE_TTL", "300"))
+HTTP_KEEPALIVE_TIMEOUT = float(os.environ.get("HTTP_KEEPALIVE_TIMEOUT", "30"))
+
+# نقطة المقاييس (0 = معطلة)
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))
+
+# كاش التحويلات والروابط المختصرة
+REDIRECT_CACHE_SIZE = int(os.environ.get("REDIRECT_CACHE_SIZE", "5000"))
+REDIRECT_DEFAULT_TTL = float(os.environ.get("REDIRECT_DEFAULT_TTL", "600"))
+REDIRECT_MAX_TTL = float(os.environ.get("REDIRECT_MAX_TTL", "86400"))
+# الحد الأدنى عند no-cache (الروابط المختصرة ثابتة عملياً)، 0 = احترام الترويسة حرفياً
+REDIRECT_MIN_TTL = float(os.environ.get("REDIRECT_MIN_TTL", "60"))
+
+# صحة المضيفين والمرايا والطلبات الاحتياطية
+# مثال: [["arabseed.ink", "arabseed.cam", "asd.rest"]]
+MIRROR_GROUPS = json.loads(os.environ.get("MIRROR_GROUPS", "[]"))
+HOST_HEALTH_WINDOW = 200
+HOST_MIN_SAMPLES = 20
+HOST_SLOW_THRESHOLD = float(os.environ.get("HOST_SLOW_THRESHOLD", "8"))
+HOST_ERROR_THRESHOLD = float(os.environ.get("HOST_ERROR_THRESHOLD", "0.3"))
+HEDGED_REQUESTS = os.environ.get("HEDGED_REQUESTS", "1") == "1"
+HEDGE_MIN_DELAY = 0.5
+HEDGE_BUDGET_RATIO = float(os.environ.get("HEDGE_BUDGET_RATIO", "0.05"))
+HEDGE_BUDGET_BURST = 10
+
+# فحص الروابط المباشرة قبل عرضها (HEAD أو Range: bytes=0-0)
+PROBE_LINKS = os.environ.get("PROBE_LINKS", "1") == "1"
+PROBE_CACHE_SIZE = 5000
+PROBE_CACHE_TTL = int(os.environ.get("PROBE_CACHE_TTL", "900"))
+PROBE_DEAD_TTL = 120
+
+# وضع التشغيل: polling أو webhook (يمكن تشغيل عدة نسخ خلف reverse proxy)
+BOT_MODE = os.environ.get("BOT_MODE", "polling")
+# رقم النسخة يُضاف لمنفذ webhook والمقاييس، والنسخة 0 فقط تسجل الـ webhook لدى Telegram
+INSTANCE_ID = int(os.environ.get("INSTANCE_ID", "0"))
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.environ.get("WEBHOOK_PATH", "/telegram")
+WEBHOOK_LISTEN = os.environ.get("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.environ.get("WEBHOOK_PORT", "8443"))
+# مشاركة نفس المنفذ بين النسخ (SO_REUSEPORT) بدلاً من منفذ لكل نسخة
+WEBHOOK_REUSE_PORT = os.environ.get("WEBHOOK_REUSE_PORT", "0") == "1"
+# السر الافتراضي مشتق من التوكن حتى يتطابق بين كل النسخ
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET") or hashlib.sha256(TOKEN.encode()).hexdigest()[:32]
+WEBHOOK_MAX_CONNECTIONS = int(os.environ.get("WEBHOOK_MAX_CONNECTIONS", "40"))
+SHUTDOWN_DRAIN_TIMEOUT = float(os.environ.get("SHUTDOWN_DRAIN_TIMEOUT", "30"))
+
+# ترتيب محركات استخراج HTML (fast, lxml, soup)
+HTML_EXTRACTORS = os.environ.get("HTML_EXTRACTORS", "fast,lxml,soup")
+# قواعد الاستخراج لكل موقع: ملف JSON اختياري يحل محل القواعد المدمجة ويُعاد تحميله عند تغييره
+EXTRACTION_RULES_PATH = os.environ.get("EXTRACTION_RULES_PATH", "extraction_rules.json")
+EXTRACTION_RULES_CHECK_INTERVAL = float(os.environ.get("EXTRACTION_RULES_CHECK_INTERVAL", "10"))
+# وزن كل محاولة في معدل إصابة القاعدة (كلما زاد تكيّف الترتيب أسرع مع تغيير تصميم الموقع)
+EXTRACTION_RULE_DECAY = float(os.environ.get("EXTRACTION_RULE_DECAY", "0.05"))
+
+# القراءة المتدفقة للصفحات
+MAX_PAGE_BYTES = int(os.environ.get("MAX_PAGE_BYTES", str(2 * 1024 * 1024)))
+STREAM_CHUNK_SIZE = 16 * 1024
+STREAM_MATCH_OVERLAP = 4096
+
+# كاش الروابط المستخرجة (روابط التحميل المباشرة تبقى صالحة لفترة محدودة)
+RESOLUTION_CACHE_SIZE = int(os.environ.get("RESOLUTION_CACHE_SIZE", "2000"))
+RESOLUTION_CACHE_TTL = float(os.environ.get("RESOLUTION_CACHE_TTL", "1800"))
 
 # ----------------- إعدادات التخزين -----------------
+class UserSession:
+    """جلسة مستخدم مضغوطة مع سجل محدود الحجم"""
+    __slots__ = ('user_id', 'last_url', 'last_title', 'episode_number', 'auto_mode', 'history', 'last_seen')
+    
+    def __init__(self, user_id: int, last_url: Optional[str] = None, last_title: Optional[str] = None,
+                 episode_number: Optional[int] = None, auto_mode: bool = False,
+                 history: Optional[List[dict]] = None, last_seen: Optional[float] = None):
+        self.user_id = user_id
+        self.last_url = last_url
+        self.last_title = last_title
+        self.episode_number = episode_number
+        self.auto_mode = auto_mode
+        self.history = deque(history or (), maxlen=SESSION_HISTORY_SIZE)
+        self.last_seen = last_seen or time.time()
+    
+    def to_row(self) -> Tuple[int, str, float]:
+        data = {
+            'last_url': self.last_url,
+            'last_title': self.last_title,
+            'episode_number': self.episode_number,
+            'auto_mode': self.auto_mode,
+            'history': list(self.history),
+        }
+        return self.user_id, json.dumps(data, ensure_ascii=False), self.last_seen
+    
+    @classmethod
+    def from_row(cls, user_id: int, data: str, last_seen: float) -> "UserSession":
+        return cls(user_id, last_seen=last_seen, **json.loads(data))
+
+class SessionStore:
+    """تخزين الجلسات في SQLite (اتصال للقراءة في حلقة الأحداث واتصال للكتابة في خيط منفصل)"""
+    def __init__(self, path: str):
+        self.path = path
+        self._writer = self._connect()
+        self._writer.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "user_id INTEGER PRIMARY KEY, data TEXT NOT NULL, last_seen REAL NOT NULL)"
+        )
+        self._writer.execute("CREATE INDEX IF NOT EXISTS sessions_last_seen ON sessions (last_seen)")
+        self._writer.commit()
+        self._reader = self._connect()
+    
+    def _connect(self) -> sqlite3.Connection:
+        # وضع WAL يسمح بالقراءة أثناء الكتابة دون انتظار
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+    
+    def load(self, user_id: int) -> Optional[UserSession]:
+        row = self._reader.execute(
+            "SELECT user_id, data, last_seen FROM sessions WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return UserSession.from_row(*row) if row else None
+    
+    def write_many(self, rows: List[Tuple[int, str, float]]):
+        with self._writer:
+            self._writer.executemany(
+                "INSERT INTO sessions (user_id, data, last_seen) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, last_seen = excluded.last_seen",
+                rows,
+            )
+    
+    def count_since(self, since: float) -> int:
+        return self._writer.execute("SELECT COUNT(*) FROM sessions WHERE last_seen >= ?", (since,)).fetchone()[0]
+    
+    def close(self):
+        self._reader.close()
+        self._writer.close()
+
 class Storage:
-    """تخزين بيانات المستخدمين"""
+    """تخزين بيانات المستخدمين (LRU في الذاكرة مع كتابة مؤجلة إلى SQLite)"""
+    def __init__(self, max_users: int = SESSION_MAX_USERS, idle_ttl: float = SESSION_IDLE_TTL):
+        self.max_users = max_users
+        self.idle_ttl = idle_ttl
+        self.user_sessions: "OrderedDict[int, UserSession]" = OrderedDict()
+        self.store: Optional[SessionStore] = None
+        self._dirty = set()
+        self._pending_rows: Dict[int, Tuple[int, str, float]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        
+    def get_session(self, user_id: int) -> UserSession:
+        session = self.user_sessions.get(user_id)
+        if session is None:
+            pending = self._pending_rows.get(user_id)
+            if pending is not None:
+                session = UserSession.from_row(*pending)
+            elif self.store is not None:
+                session = self.store.load(user_id)
+            if session is None:
+                session = UserSession(user_id)
+            self.user_sessions[user_id] = session
+            self._evict_over_capacity()
+        else:
+            self.user_sessions.move_to_end(user_id)
+        session.last_seen = time.time()
+        self._dirty.add(user_id)
+        return session
+    
+    def mark_dirty(self, user_id: int):
+        self._dirty.add(user_id)
+    
+    def add_history(self, user_id: int, url: str, title: str):
+        """تسجيل معالجة ناجحة في سجل المستخدم"""
+        session = self.get_session(user_id)
+        session.last_url = url
+        session.last_title = title
+        session.history.append({
+            'url': url,
+            'title': title,
+            'time': datetime.now().isoformat()
+        })
+        self.mark_dirty(user_id)
+    
+    def _evict(self, user_id: int):
+        session = self.user_sessions.pop(user_id)
+        if user_id in self._dirty:
+            # الجلسة لم تُحفظ بعد: تبقى في الدفعة القادمة
+            self._dirty.discard(user_id)
+            self._pending_rows[user_id] = session.to_row()
+    
+    def _evict_over_capacity(self):
+        while len(self.user_sessions) > self.max_users:
+            self._evict(next(iter(self.user_sessions)))
+    
+    def evict_idle(self):
+        cutoff = time.time() - self.idle_ttl
+        # الجلسات مرتبة من الأقدم استخداماً إلى الأحدث
+        while self.user_sessions:
+            user_id, session = next(iter(self.user_sessions.items()))
+            if session.last_seen >= cutoff:
+                break
+            self._evict(user_id)
+    
+    async def flush(self):
+        """كتابة الجلسات المعدلة على دفعة واحدة في خيط منفصل"""
+        rows = dict(self._pending_rows)
+        self._pending_rows.clear()
+        for user_id in self._dirty:
+            session = self.user_sessions.get(user_id)
+            if session is not None:
+                rows[user_id] = session.to_row()
+        self._dirty.clear()
+        if not rows or self.store is None:
+            return
+        try:
+            await asyncio.to_thread(self.store.write_many, list(rows.values()))
+        except Exception as e:
+            logger.error(f"Error flushing sessions: {e}")
+            for user_id, row in rows.items():
+                self._pending_rows.setdefault(user_id, row)
+    
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(SESSION_FLUSH_INTERVAL)
+            await self.flush()
+            self.evict_idle()
+    
+    async def start(self, path: str = SESSION_DB_PATH):
+        if path:
+            self.store = await asyncio.to_thread(SessionStore, path)
+        self._flush_task = asyncio.create_task(self._flush_loop())
+    
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+    
+    async def active_users(self, window: float = ACTIVE_USERS_WINDOW) -> int:
+        """عدد المستخدمين النشطين خلال الفترة (من الذاكرة وقاعدة البيانات)"""
+        since = time.time() - window
+        if self.store is None:
+            return sum(1 for session in self.user_sessions.values() if session.last_seen >= since)
+        await self.flush()
+        return await asyncio.to_thread(self.store.count_since, since)
+
+storage = Storage()
+
+class WatchStore:
+    """اشتراكات متابعة المسلسلات في SQLite (مجمعة حسب المسلسل حتى يُفحص كل مسلسل مرة واحدة)"""
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS watch_series ("
+                "series TEXT PRIMARY KEY, next_url TEXT NOT NULL, episode INTEGER NOT NULL, title TEXT, "
+                "etag TEXT, last_modified TEXT, next_check REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS watch_series_next_check ON watch_series (next_check)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS watches ("
+                "user_id INTEGER NOT NULL, series TEXT NOT NULL, PRIMARY KEY (user_id, series))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS watches_series ON watches (series)")
+    
+    def add(self, user_id: int, series: str, next_url: str, episode: int, title: str, next_check: float) -> bool:
+        """إضافة اشتراك (False إذا تجاوز المستخدم الحد الأقصى)"""
+        with self._lock, self._conn:
+            count = self._conn.execute("SELECT COUNT(*) FROM watches WHERE user_id = ?", (user_id,)).fetchone()[0]
+            if count >= WATCH_MAX_PER_USER:
+                return False
+            # المسلسل المتابَع مسبقاً يحتفظ بحالته (الحلقة المنتظرة وترويسات التحقق)
+            self._conn.execute(
+                "INSERT OR IGNORE INTO watch_series (series, next_url, episode, title, next_check) VALUES (?, ?, ?, ?, ?)",
+                (series, next_url, episode, title, next_check),
+            )
+            self._conn.execute("INSERT OR IGNORE INTO watches (user_id, series) VALUES (?, ?)", (user_id, series))
+            return True
+    
+    def remove(self, user_id: int, series: Optional[str] = None) -> int:
+        """إلغاء اشتراك واحد أو كل اشتراكات المستخدم وحذف المسلسلات التي لم يعد يتابعها أحد"""
+        with self._lock, self._conn:
+            if series is None:
+                removed = self._conn.execute("DELETE FROM watches WHERE user_id = ?", (user_id,)).rowcount
+            else:
+                removed = self._conn.execute(
+                    "DELETE FROM watches WHERE user_id = ? AND series = ?", (user_id, series)
+                ).rowcount
+            self._conn.execute("DELETE FROM watch_series WHERE series NOT IN (SELECT series FROM watches)")
+            return removed
+    
+    def user_watches(self, user_id: int) -> List[Tuple[str, int]]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT s.title, s.episode FROM watches w JOIN watch_series s ON s.series = w.series "
+                "WHERE w.user_id = ? ORDER BY s.title", (user_id,)
+            ).fetchall()
+    
+    def due(self, now: float, limit: int) -> List[Tuple[str, str, int, str, Optional[str], Optional[str]]]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT series, next_url, episode, title, etag, last_modified FROM watch_series "
+                "WHERE next_check <= ? ORDER BY next_check LIMIT ?", (now, limit)
+            ).fetchall()
+    
+    def postpone(self, series: str, next_check: float):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE watch_series SET next_check = ? WHERE series = ?", (next_check, series))
+    
+    def watchers(self, series: str) -> List[int]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT user_id FROM watches WHERE series = ?", (series,))]
+    
+    def update(self, series: str, next_url: str, episode: int, etag: Optional[str],
+               last_modified: Optional[str], next_check: float):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE watch_series SET next_url = ?, episode = ?, etag = ?, last_modified = ?, next_check = ? "
+                "WHERE series = ?", (next_url, episode, etag, last_modified, next_check, series)
+            )
+    
+    def counts(self) -> Tuple[int, int]:
+        with self._lock:
+            return (self._conn.execute("SELECT COUNT(*) FROM watches").fetchone()[0],
+                    self._conn.execute("SELECT COUNT(*) FROM watch_series").fetchone()[0])
+    
+    def close(self):
+        self._conn.close()
+
+# ----------------- عميل HTTP المشترك -----------------
+class HttpClient:
+    """جلسة HTTP واحدة للتطبيق بالكامل مع عدادات إعادة استخدام الاتصالات"""
+    def __init__(self):
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.stats = {
+            'requests': 0,
+            'connections_created': 0,
+            'connections_reused': 0,
+            'pool_waits': 0,
+            'pool_wait_time': 0.0,
+            'dns_cache_hits': 0,
+            'dns_lookups': 0,
+        }
+    
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            raise RuntimeError("HTTP client is not started")
+        return self._session
+    
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        trace = aiohttp.TraceConfig()
+        stats = self.stats
+        
+        async def on_request_start(session, ctx, params):
+            stats['requests'] += 1
+        
+        async def on_connection_create_end(session, ctx, params):
+            stats['connections_created'] += 1
+        
+        async def on_connection_reuseconn(session, ctx, params):
+            stats['connections_reused'] += 1
+        
+        async def on_connection_queued_start(session, ctx, params):
+            ctx.queued_at = time.monotonic()
+        
+        async def on_connection_queued_end(session, ctx, params):
+            stats['pool_waits'] += 1
+            stats['pool_wait_time'] += time.monotonic() - getattr(ctx, 'queued_at', time.monotonic())
+        
+        async def on_dns_cache_hit(session, ctx, params):
+            stats['dns_cache_hits'] += 1
+        
+        async def on_dns_resolvehost_end(session, ctx, params):
+            stats['dns_lookups'] += 1
+        
+        trace.on_request_start.append(on_request_start)
+        trace.on_connection_create_end.append(on_connection_create_end)
+        trace.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace.on_connection_queued_start.append(on_connection_queued_start)
+        trace.on_connection_queued_end.append(on_connection_queued_end)
+        trace.on_dns_cache_hit.append(on_dns_cache_hit)
+        trace.on_dns_resolvehost_end.append(on_dns_resolvehost_end)
+        return trace
+    
+    async def start(self):
+        if self._session is not None and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_LIMIT,
+            limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            headers={"User-Agent": USER_AGENT},
+            timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+            trace_configs=[self._trace_config()],
+        )
+    
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+    
+    def reuse_ratio(self, stats: Optional[Dict[str, float]] = None) -> float:
+        stats = stats or self.stats
+        total = stats['connections_created'] + stats['connections_reused']
+        return stats['connections_reused'] / total if total else 0.0
+    
+    def avg_pool_wait_ms(self, stats: Optional[Dict[str, float]] = None) -> float:
+        stats = stats or self.stats
+        waits = stats['pool_waits']
+        return stats['pool_wait_time'] * 1000 / waits if waits else 0.0
+
+http_client = HttpClient()
+
+# ----------------- قياس زمن المراحل -----------------
+# حدود المدرج التكراري بالثواني (تدرج لوغاريتمي تقريباً)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class Histogram:
+    """مدرج تكراري بحدود ثابتة بأسلوب Prometheus"""
+    __slots__ = ('counts', 'sum', 'count')
+    
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+    
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+    
+    def merge(self, other: "Histogram"):
+        for i, n in enumerate(other.counts):
+            self.counts[i] += n
+        self.sum += other.sum
+        self.count += other.count
+    
+    def percentile(self, pct: float) -> float:
+        """تقدير النسبة المئوية بالاستيفاء الخطي داخل الحد المناسب"""
+        if not self.count:
+            return 0.0
+        rank = pct / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = LATENCY_BUCKETS[i - 1] if i > 0 else 0.0
+                upper = LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else LATENCY_BUCKETS[-1]
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return LATENCY_BUCKETS[-1]
+
+class StageTimer:
+    """مؤقت مرحلة واحدة يسجل الزمن والحجم والنتيجة عند الخروج"""
+    __slots__ = ('metrics', 'stage', 'host', 'started', 'bytes', 'outcome')
+    
+    def __init__(self, metrics: "Metrics", stage: str, host: str):
+        self.metrics = metrics
+        self.stage = stage
+        self.host = host
+        self.bytes = 0
+        self.outcome = 'ok'
+    
+    def __enter__(self) -> "StageTimer":
+        self.started = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.outcome = 'timeout' if issubclass(exc_type, asyncio.TimeoutError) else 'cancelled' if issubclass(exc_type, asyncio.CancelledError) else 'error'
+        self.metrics.observe(self.stage, self.host, time.perf_counter() - self.started, self.outcome, self.bytes)
+        return False
+
+class Metrics:
+    """أزمنة وأحجام ونتائج كل مرحلة من مراحل الاستخراج لكل مضيف"""
     def __init__(self):
-        self.user_sessions = {}
-        self.processing_users = set()
+        self.durations: Dict[Tuple[str, str], Histogram] = {}
+        self.bytes: Dict[Tuple[str, str], int] = {}
+        self.outcomes: Dict[Tuple[str, str, str], int] = {}
+        # مقاييس عمليات الاستخراج المنفصلة كما وصلت من كل عامل
+        self.remote: Dict[Any, "Metrics"] = {}
+    
+    def stage(self, stage: str, url: str = '') -> StageTimer:
+        return StageTimer(self, stage, urlparse(url).netloc if url else '')
+    
+    def observe(self, stage: str, host: str, seconds: float, outcome: str = 'ok', nbytes: int = 0):
+        key = (stage, host)
+        histogram = self.durations.get(key)
+        if histogram is None:
+            histogram = self.durations[key] = Histogram()
+        histogram.observe(seconds)
+        if nbytes:
+            self.bytes[key] = self.bytes.get(key, 0) + nbytes
+        outcome_key = (stage, host, outcome)
+        self.outcomes[outcome_key] = self.outcomes.get(outcome_key, 0) + 1
+    
+    def merge(self, other: "Metrics"):
+        for key, histogram in other.durations.items():
+            self.durations.setdefault(key, Histogram()).merge(histogram)
+        for key, n in other.bytes.items():
+            self.bytes[key] = self.bytes.get(key, 0) + n
+        for key, n in other.outcomes.items():
+            self.outcomes[key] = self.outcomes.get(key, 0) + n
+    
+    def combined(self) -> "Metrics":
+        """مقاييس هذه العملية مع مقاييس عمال الاستخراج"""
+        if not self.remote:
+            return self
+        combined = Metrics()
+        for source in (self, *self.remote.values()):
+            combined.merge(source)
+        return combined
+    
+    def export(self) -> Dict:
+        """تمثيل JSON يرسله العامل إلى الواجهة مع كل نتيجة"""
+        return {
+            'durations': [[stage, host, h.counts, h.sum, h.count] for (stage, host), h in self.durations.items()],
+            'bytes': [[stage, host, n] for (stage, host), n in self.bytes.items()],
+            'outcomes': [[stage, host, outcome, n] for (stage, host, outcome), n in self.outcomes.items()],
+        }
+    
+    @classmethod
+    def from_export(cls, data: Dict) -> "Metrics":
+        metrics = cls()
+        for stage, host, counts, total, count in data['durations']:
+            histogram = metrics.durations[(stage, host)] = Histogram()
+            histogram.counts, histogram.sum, histogram.count = counts, total, count
+        for stage, host, n in data['bytes']:
+            metrics.bytes[(stage, host)] = n
+        for stage, host, outcome, n in data['outcomes']:
+            metrics.outcomes[(stage, host, outcome)] = n
+        return metrics
+    
+    def by_stage(self) -> Dict[str, Histogram]:
+        merged: Dict[str, Histogram] = {}
+        for (stage, _), histogram in self.combined().durations.items():
+            merged.setdefault(stage, Histogram()).merge(histogram)
+        return merged
+    
+    def by_host(self) -> Dict[str, Histogram]:
+        merged: Dict[str, Histogram] = {}
+        for (_, host), histogram in self.combined().durations.items():
+            if host:
+                merged.setdefault(host, Histogram()).merge(histogram)
+        return merged
+    
+    def render_prometheus(self) -> str:
+        """تصدير المقاييس بصيغة Prometheus النصية"""
+        def labels(**values) -> str:
+            return ','.join(f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for k, v in values.items())
+        
+        combined = self.combined()
+        lines = [
+            '# HELP arabseed_stage_duration_seconds Duration of each resolution stage.',
+            '# TYPE arabseed_stage_duration_seconds histogram',
+        ]
+        for (stage, host), histogram in sorted(combined.durations.items()):
+            cumulative = 0
+            for bound, n in zip(LATENCY_BUCKETS + (float('inf'),), histogram.counts):
+                cumulative += n
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'arabseed_stage_duration_seconds_bucket{{{labels(stage=stage, host=host, le=le)}}} {cumulative}')
+            lines.append(f'arabseed_stage_duration_seconds_sum{{{labels(stage=stage, host=host)}}} {histogram.sum}')
+            lines.append(f'arabseed_stage_duration_seconds_count{{{labels(stage=stage, host=host)}}} {histogram.count}')
+        
+        lines += ['# HELP arabseed_stage_bytes_total Bytes read per stage.', '# TYPE arabseed_stage_bytes_total counter']
+        for (stage, host), n in sorted(combined.bytes.items()):
+            lines.append(f'arabseed_stage_bytes_total{{{labels(stage=stage, host=host)}}} {n}')
+        
+        lines += ['# HELP arabseed_stage_outcomes_total Stage outcomes.', '# TYPE arabseed_stage_outcomes_total counter']
+        for (stage, host, outcome), n in sorted(combined.outcomes.items()):
+            lines.append(f'arabseed_stage_outcomes_total{{{labels(stage=stage, host=host, outcome=outcome)}}} {n}')
+        
+        counters = {f'arabseed_http_{name}': value for name, value in resolver_pool.combined_stats('http', http_client.stats).items()}
+        counters.update({f'arabseed_cache_{name}': value for name, value in resolution_cache.stats.items()})
+        counters.update({f'arabseed_redirect_cache_{name}': value for name, value in resolver_pool.combined_stats('redirect_cache', redirect_cache.stats).items()})
+        counters.update({f'arabseed_probe_cache_{name}': value for name, value in resolver_pool.combined_stats('probe_cache', probe_cache.stats).items()})
+        counters.update({f'arabseed_host_{name}': value for name, value in resolver_pool.combined_stats('host_health', host_health.stats).items()})
+        counters.update({f'arabseed_stage_{name}': value for name, value in resolver_pool.combined_stats('stage_timeouts', stage_timeouts.stats).items()})
+        counters.update({f'arabseed_prefetch_{name}': value for name, value in prefetcher.stats.items()})
+        counters.update({f'arabseed_watch_{name}': value for name, value in watch_poller.stats.items()})
+        counters.update({f'arabseed_inline_{name}': value for name, value in inline_stats.items()})
+        counters.update({f'arabseed_extraction_rule_{name}': value for name, value in resolver_pool.combined_stats('site_rules', site_rules.stats).items()})
+        for name, value in counters.items():
+            lines += [f'# TYPE {name} counter', f'{name} {value}']
+        
+        for name in ('attempts', 'hits'):
+            lines += [f'# HELP arabseed_extraction_rule_{name}_total Extraction rule {name} per site profile.',
+                      f'# TYPE arabseed_extraction_rule_{name}_total counter']
+            for profile in site_rules.profiles:
+                for field, rules in profile.fields.items():
+                    for rule in rules:
+                        value = getattr(rule, name)
+                        lines.append(f'arabseed_extraction_rule_{name}_total{{{labels(profile=profile.name, field=field, rule=rule.name)}}} {value}')
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+
+async def start_metrics_server() -> Optional[web.AppRunner]:
+    """تشغيل نقطة /metrics المحلية إذا تم تحديد METRICS_PORT"""
+    if not METRICS_PORT:
+        return None
+    
+    async def handle_metrics(request: web.Request) -> web.Response:
+        return web.Response(text=metrics.render_prometheus(), content_type='text/plain', charset='utf-8')
+    
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    port = METRICS_PORT + INSTANCE_ID
+    await web.TCPSite(runner, METRICS_HOST, port).start()
+    logger.info(f"Metrics endpoint listening on http://{METRICS_HOST}:{port}/metrics")
+    return runner
+
+# ----------------- صحة المضيفين والمرايا -----------------
+class HostStats:
+    """نافذة متحركة لأزمنة ونتائج طلبات مضيف واحد"""
+    __slots__ = ('latencies', 'failures', 'ewma')
+    
+    def __init__(self):
+        self.latencies = deque(maxlen=HOST_HEALTH_WINDOW)
+        self.failures = deque(maxlen=HOST_HEALTH_WINDOW)
+        self.ewma = 0.0
+    
+    def record(self, seconds: float, ok: bool):
+        self.latencies.append(seconds)
+        self.failures.append(not ok)
+        self.ewma = seconds if len(self.latencies) == 1 else 0.8 * self.ewma + 0.2 * seconds
+    
+    @property
+    def samples(self) -> int:
+        return len(self.latencies)
+    
+    def p95(self) -> float:
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] if ordered else 0.0
+    
+    def error_rate(self) -> float:
+        return sum(self.failures) / len(self.failures) if self.failures else 0.0
+
+class HostHealthRegistry:
+    """تتبع صحة كل مضيف (netloc) لاختيار المرآة الأسرع وإرسال طلبات احتياطية"""
+    def __init__(self, mirror_groups: List[List[str]]):
+        self.hosts: Dict[str, HostStats] = {}
+        self.mirrors: Dict[str, List[str]] = {}
+        for group in mirror_groups:
+            for host in group:
+                self.mirrors[host] = [mirror for mirror in group if mirror != host]
+        self.stats = {'requests': 0, 'hedges': 0, 'hedge_wins': 0, 'rewrites': 0}
+    
+    def record(self, url: str, seconds: float, ok: bool):
+        host = urlparse(url).netloc
+        stats = self.hosts.get(host)
+        if stats is None:
+            stats = self.hosts[host] = HostStats()
+        stats.record(seconds, ok)
+        self.stats['requests'] += 1
+    
+    def is_unhealthy(self, host: str) -> bool:
+        stats = self.hosts.get(host)
+        if stats is None or stats.samples < HOST_MIN_SAMPLES:
+            return False
+        return stats.error_rate() > HOST_ERROR_THRESHOLD or stats.p95() > HOST_SLOW_THRESHOLD
+    
+    def score(self, host: str) -> float:
+        """تقدير زمن الاستجابة المتوقع (المرايا غير المجربة تُعطى فرصة)"""
+        stats = self.hosts.get(host)
+        if stats is None or stats.samples < HOST_MIN_SAMPLES:
+            return 0.0
+        return stats.ewma * (1 + 4 * stats.error_rate())
+    
+    def best_mirror(self, host: str) -> Optional[str]:
+        candidates = [mirror for mirror in self.mirrors.get(host, ()) if not self.is_unhealthy(mirror)]
+        return min(candidates, key=self.score) if candidates else None
+    
+    def rewrite(self, url: str) -> str:
+        """تحويل الطلب إلى مرآة مكافئة إذا كان المضيف بطيئاً أو متعطلاً"""
+        p = urlparse(url)
+        if not self.is_unhealthy(p.netloc):
+            return url
+        mirror = self.best_mirror(p.netloc)
+        if mirror is None or self.score(mirror) >= self.score(p.netloc):
+            return url
+        self.stats['rewrites'] += 1
+        return urlunparse(p._replace(netloc=mirror))
+    
+    def alternative(self, url: str) -> str:
+        """رابط الطلب الاحتياطي: أفضل مرآة إن وُجدت وإلا نفس الرابط"""
+        p = urlparse(url)
+        mirror = self.best_mirror(p.netloc)
+        return urlunparse(p._replace(netloc=mirror)) if mirror else url
+    
+    def hedge_delay(self, url: str) -> Optional[float]:
+        """المهلة قبل إرسال طلب احتياطي (p95 للمضيف)، أو None إذا لم تتوفر عينات كافية"""
+        if not HEDGED_REQUESTS:
+            return None
+        stats = self.hosts.get(urlparse(url).netloc)
+        if stats is None or stats.samples < HOST_MIN_SAMPLES:
+            return None
+        return max(HEDGE_MIN_DELAY, stats.p95())
+    
+    def take_hedge(self) -> bool:
+        """ميزانية الطلبات الاحتياطية: نسبة صغيرة من إجمالي الطلبات فقط"""
+        if self.stats['hedges'] >= HEDGE_BUDGET_RATIO * self.stats['requests'] + HEDGE_BUDGET_BURST:
+            return False
+        self.stats['hedges'] += 1
+        return True
+
+host_health = HostHealthRegistry(MIRROR_GROUPS)
+
+async def hedged(url: str, fetch: Callable[[str], Awaitable[Any]]) -> Any:
+    """تنفيذ الطلب مع طلب احتياطي واحد إذا تجاوز p95 للمضيف (أول نتيجة ناجحة تفوز)"""
+    delay = host_health.hedge_delay(url)
+    if delay is None:
+        return await fetch(url)
+    
+    primary = asyncio.ensure_future(fetch(url))
+    tasks = {primary}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done or not host_health.take_hedge():
+            return await primary
         
-    def is_processing(self, user_id: int) -> bool:
-        return user_id in self.processing_users
+        backup = asyncio.ensure_future(fetch(host_health.alternative(url)))
+        tasks.add(backup)
+        error = None
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is backup:
+                        host_health.stats['hedge_wins'] += 1
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+# ----------------- المهل الزمنية وإعادة المحاولة -----------------
+class Deadline:
+    """ميزانية زمنية واحدة لطلب المستخدم تُقسَّم على مراحل الاستخراج"""
+    __slots__ = ('expires_at',)
+    
+    def __init__(self, budget: float):
+        self.expires_at = time.monotonic() + budget
+    
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+current_deadline: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar('current_deadline', default=None)
+
+@contextmanager
+def request_deadline(budget: float):
+    """تفعيل ميزانية الطلب للمهام المتفرعة منه (لا تتجاوز ميزانية الطلب الخارجي إن وُجد)"""
+    outer = current_deadline.get()
+    if outer is not None:
+        budget = min(budget, outer.remaining())
+    token = current_deadline.set(Deadline(budget))
+    try:
+        yield
+    finally:
+        current_deadline.reset(token)
+
+def remaining_budget(default: float = REQUEST_BUDGET) -> float:
+    deadline = current_deadline.get()
+    return deadline.remaining() if deadline is not None else default
+
+class StageTimeouts:
+    """مهلة كل مرحلة تتكيف مع الزمن الملاحظ (p99 × معامل) ولا تتجاوز المتبقي من الميزانية"""
+    def __init__(self):
+        self._adaptive: Dict[str, float] = {}
+        self._refreshed = 0.0
+        self.stats = {'retries': 0, 'budget_exhausted': 0}
+    
+    def adaptive(self, stage: str) -> float:
+        now = time.monotonic()
+        if now - self._refreshed > STAGE_TIMEOUT_REFRESH:
+            self._refreshed = now
+            self._adaptive = {
+                name: min(STAGE_TIMEOUT_MAX, max(STAGE_TIMEOUT_MIN, histogram.percentile(99) * STAGE_TIMEOUT_FACTOR))
+                for name, histogram in metrics.by_stage().items()
+                if histogram.count >= STAGE_TIMEOUT_MIN_SAMPLES
+            }
+        return self._adaptive.get(stage, STAGE_TIMEOUT_MAX)
+    
+    def timeout_for(self, stage: str) -> float:
+        return min(self.adaptive(stage), remaining_budget(float('inf')))
+    
+    def client_timeout(self, stage: str) -> aiohttp.ClientTimeout:
+        """مهلة aiohttp للمرحلة (TimeoutError فوراً إذا نفدت الميزانية)"""
+        timeout = self.timeout_for(stage)
+        if timeout <= 0:
+            self.stats['budget_exhausted'] += 1
+            raise asyncio.TimeoutError(f"Request budget exhausted before {stage}")
+        return aiohttp.ClientTimeout(total=timeout)
+
+stage_timeouts = StageTimeouts()
+
+async def with_retries(stage: str, call: Callable[[], Awaitable[Any]],
+                       retry_if: Optional[Callable[[Any], bool]] = None) -> Any:
+    """إعادة محاولة المرحلة بتأخير عشوائي متزايد ما دام في الميزانية وقت كافٍ لمحاولة أخرى"""
+    for attempt in range(RETRY_ATTEMPTS + 1):
+        error = None
+        try:
+            result = await call()
+            if retry_if is None or not retry_if(result):
+                return result
+        except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+            error = e
         
-    def set_processing(self, user_id: int, status: bool):
-        if status:
-            self.processing_users.add(user_id)
+        backoff = random.uniform(0, RETRY_BASE_DELAY * 2 ** attempt)
+        if attempt == RETRY_ATTEMPTS or remaining_budget(float('inf')) < backoff + STAGE_TIMEOUT_MIN:
+            if error is not None:
+                raise error
+            return result
+        stage_timeouts.stats['retries'] += 1
+        logger.info(f"Retrying {stage} in {backoff:.2f}s ({error or 'retryable response'})")
+        await asyncio.sleep(backoff)
+
+# ----------------- دوال مساعدة -----------------
+def extract_base_url(url: str) -> str:
+    """استخراج الرابط الأساسي"""
+    parsed_url = urlparse(url)
+    return f"{parsed_url.scheme}://{parsed_url.netloc}"
+
+def extract_title_from_url(url: str) -> str:
+    """استخراج العنوان من الرابط"""
+    parsed_url = urlparse(url)
+    path = unquote(parsed_url.path)
+    path_parts = path.strip('/').split('-')
+    title = ' '.join(path_parts).replace('.html', '').title()
+    
+    if title.startswith("مسلسل"):
+        words = title.split()
+        new_title = []
+        for word in words:
+            new_title.append(word)
+            if any(char.isdigit() for char in word):
+                break
+        title = ' '.join(new_title)
+    
+    return title
+
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+_MAX_AGE_RE = re.compile(r'(?:^|,)\s*max-age\s*=\s*(\d+)', re.I)
+# مضيفون يرفضون HEAD فنستخدم GET معهم مباشرة
+_head_unsupported_hosts = set()
+
+def redirect_ttl(response: aiohttp.ClientResponse) -> float:
+    """مدة صلاحية التحويل حسب ترويسات الكاش (أو افتراضياً حسب نوع التحويل)"""
+    cache_control = response.headers.get('Cache-Control', '')
+    max_age = _MAX_AGE_RE.search(cache_control)
+    if max_age:
+        return min(float(max_age.group(1)), REDIRECT_MAX_TTL)
+    if 'no-store' in cache_control or 'no-cache' in cache_control:
+        return REDIRECT_MIN_TTL
+    expires = response.headers.get('Expires')
+    if expires:
+        try:
+            expires_at = parsedate_to_datetime(expires).timestamp()
+            date = response.headers.get('Date')
+            now = parsedate_to_datetime(date).timestamp() if date else time.time()
+            return max(0.0, min(expires_at - now, REDIRECT_MAX_TTL))
+        except (TypeError, ValueError):
+            return REDIRECT_MIN_TTL
+    return REDIRECT_MAX_TTL if response.status in (301, 308) else REDIRECT_DEFAULT_TTL
+
+async def _redirect_hop(session: aiohttp.ClientSession, url: str, headers: Optional[dict]) -> Tuple[int, Optional[str], float]:
+    """خطوة تحويل واحدة بطلب HEAD أولاً ثم GET عند الحاجة"""
+    host = urlparse(url).netloc
+    methods = ('GET',) if host in _head_unsupported_hosts else ('HEAD', 'GET')
+    for method in methods:
+        with metrics.stage('redirect', url) as timer:
+            timeout = stage_timeouts.client_timeout('redirect')
+            started = time.perf_counter()
+            try:
+                response = await session.request(method, url, allow_redirects=False, headers=headers,
+                                                 timeout=timeout)
+            except Exception:
+                host_health.record(url, time.perf_counter() - started, False)
+                raise
+            host_health.record(url, time.perf_counter() - started, response.status < 500)
+            async with response:
+                timer.outcome = f"{method} {response.status}"
+                location = response.headers.get('Location') if response.status in REDIRECT_STATUSES else None
+                if method == 'HEAD' and response.status >= 400:
+                    # بعض الخوادم لا تدعم HEAD أو تعيد نتيجة مختلفة له
+                    if response.status in (405, 501):
+                        _head_unsupported_hosts.add(host)
+                    continue
+                return response.status, location, redirect_ttl(response) if location else REDIRECT_MAX_TTL
+    raise RuntimeError(f"No response for {url}")
+
+async def _expand_redirects(url: str, session: aiohttp.ClientSession, max_redirects: int,
+                            headers: Optional[dict]) -> Optional[Tuple[str, float]]:
+    visited = [url]
+    current_url = url
+    ttl = REDIRECT_MAX_TTL
+    status = 0
+    
+    while len(visited) <= max_redirects:
+        try:
+            status, location, hop_ttl = await with_retries(
+                'redirect', lambda: _redirect_hop(session, current_url, headers),
+                retry_if=lambda hop: hop[0] in RETRY_STATUSES,
+            )
+        except Exception as e:
+            logger.error(f"Error following redirect: {e}")
+            return None
+        if not location:
+            break
+        ttl = min(ttl, hop_ttl)
+        # Location النسبي يُحل بالنسبة للخطوة الحالية وليس الرابط الأصلي
+        current_url = urljoin(current_url, location)
+        if current_url in visited:
+            logger.warning(f"Redirect loop detected for {url}: {' -> '.join(visited + [current_url])}")
+            return None
+        visited.append(current_url)
+    
+    if status >= 400:
+        # صفحة خطأ في نهاية السلسلة: لا تُحفظ حتى لا تُخدم من الكاش بدل الوجهة الحقيقية
+        logger.warning(f"Redirect chain for {url} ended with status {status} at {current_url}")
+        return None
+    if len(visited) == 1:
+        ttl = REDIRECT_DEFAULT_TTL
+    if not 200 <= status < 300:
+        # نهاية غير مكتملة (حد التحويلات أو 3xx بلا Location): تُستخدم دون حفظ
+        ttl = 0
+    result = (current_url, ttl)
+    # كل خطوة وسيطة تؤدي لنفس الوجهة النهائية
+    if ttl > 0:
+        for hop in visited[1:-1]:
+            redirect_cache.put(hop, result, ttl)
+    return result
+
+async def follow_redirect(url: str, session: aiohttp.ClientSession, max_redirects: int = 5, headers: Optional[dict] = None) -> Optional[str]:
+    """تتبع عمليات إعادة التوجيه (مع حفظ السلاسل المحلولة في الكاش)"""
+    result = await redirect_cache.get_or_resolve(
+        url,
+        lambda: _expand_redirects(url, session, max_redirects, headers),
+        cacheable=lambda result: result is not None and result[1] > 0,
+        ttl_of=lambda result: result[1],
+    )
+    return result[0] if result else None
+
+def find_last_numeric_segment_in_path(path_unquoted: str) -> Tuple[Optional[int], Optional[str]]:
+    """إيجاد الجزء الرقمي الأخير في المسار"""
+    parts = path_unquoted.strip('/').split('-')
+    for i in range(len(parts)-1, -1, -1):
+        if re.fullmatch(r'\d+', parts[i]):
+            return i, parts[i]
+    return None, None
+
+def build_episode_url_from_any(url: str, episode_number: int) -> Optional[str]:
+    """بناء رابط الحلقة"""
+    p = urlparse(url)
+    path_unquoted = unquote(p.path)
+    idx, num = find_last_numeric_segment_in_path(path_unquoted)
+    
+    if idx is None:
+        return None
+    
+    parts = path_unquoted.strip('/').split('-')[:idx+1]
+    parts[-1] = str(episode_number)
+    new_path = '/' + '-'.join(parts)
+    quoted_path = quote(new_path, safe="/%")
+    new_parsed = (p.scheme, p.netloc, quoted_path, '', '', '')
+    return urlunparse(new_parsed)
+
+def extract_episode_and_base(url: str) -> Tuple[Optional[int], Optional[callable]]:
+    """استخراج رقم الحلقة ودالة البناء"""
+    p = urlparse(url)
+    path_unquoted = unquote(p.path)
+    idx, num = find_last_numeric_segment_in_path(path_unquoted)
+    
+    if idx is None or num is None:
+        return None, None
+    
+    return int(num), lambda ep: build_episode_url_from_any(url, ep)
+
+def canonical_episode_url(url: str) -> str:
+    """توحيد رابط الحلقة لاستخدامه كمفتاح في الكاش (المسار كاملاً: مترجم ومدبلج صفحتان مختلفتان)"""
+    p = urlparse(url.strip())
+    path = quote(unquote(p.path), safe="/%").rstrip('/') or '/'
+    return urlunparse((p.scheme.lower(), p.netloc.lower(), path, '', p.query, ''))
+
+# ----------------- قواعد الاستخراج لكل موقع -----------------
+# القواعد المدمجة بنفس صيغة ملف EXTRACTION_RULES_PATH: لكل حقل قائمة قواعد بترتيبها الأولي،
+# وكل قاعدة تطابق وسوم <a> بخصائصها (href/class نمطان، class_token/id قيمتان حرفيتان،
+# within للعنصر الحاوي) أو نمطاً في نص الصفحة (pattern). القواعد ذات fallback لا تتقدم
+# على غيرها مهما ارتفع معدل إصابتها، والقاعدة ذات hosts الفارغة هي الافتراضية
+DEFAULT_EXTRACTION_RULES = {
+    "profiles": [
+        {
+            "name": "arabseed",
+            "hosts": [],
+            "fields": {
+                "download_page_url": [
+                    {"name": "download-href", "href": "/download/"},
+                    {"name": "download-class", "class": "download__btn|downloadBTn"},
+                ],
+                "server_links": [
+                    {"name": "shortlink-href", "href": "/l/"},
+                    {"name": "links-list", "within": {"tag": "ul", "class_token": "downloads__links__list"}},
+                ],
+                "button_href": [
+                    {"name": "btn-id", "id": "btn"},
+                    {"name": "btn-class", "class_token": "downloadbtn"},
+                    {"name": "query-rebuild", "rebuild_query": True, "fallback": True},
+                ],
+                "final_link": [
+                    {"name": "btn-id", "id": "btn"},
+                    {"name": "btn-class", "class_token": "downloadbtn"},
+                    {"name": "mp4-href", "href": r"\.mp4", "fallback": True},
+                ],
+            },
+        },
+    ],
+}
+
+RULE_FIELDS = ('download_page_url', 'server_links', 'button_href', 'final_link')
+_RULE_KEYS = {'name', 'tag', 'href', 'class', 'class_token', 'id', 'within', 'pattern', 'rebuild_query', 'fallback'}
+_QUERY_PARAM_RE = re.compile(r'([?&][a-zA-Z0-9_]+\d*=[^"&\']+)')
+
+class TagSelector(NamedTuple):
+    """مطابقة وسم بخصائصه مع تعابير منتظمة مُجمّعة مسبقاً"""
+    tag: Optional[str]
+    id: Optional[str]
+    class_token: Optional[str]
+    class_re: Optional[re.Pattern]
+    href_re: Optional[re.Pattern]
+    # نص حرفي يجب أن يظهر في خصائص الوسم الخام قبل تحليلها
+    needle: Optional[str]
+    
+    @classmethod
+    def compile(cls, spec: Dict[str, Any], tag: Optional[str] = 'a') -> TagSelector:
+        href, klass = spec.get('href'), spec.get('class')
+        needle = spec.get('id') or spec.get('class_token')
+        for literal in (href, klass):
+            if needle is None and literal and re.escape(literal) == literal:
+                needle = literal
+        tag = spec.get('tag', tag)
+        return cls(tag.lower() if tag else None, spec.get('id'), spec.get('class_token'),
+                   re.compile(klass) if klass else None, re.compile(href) if href else None, needle)
+    
+    @property
+    def empty(self) -> bool:
+        return self.id is None and self.class_token is None and self.class_re is None and self.href_re is None
+    
+    def matches(self, attrs: Dict[str, str]) -> bool:
+        if self.id is not None and attrs.get('id') != self.id:
+            return False
+        if self.class_token is not None and not _has_class(attrs, self.class_token):
+            return False
+        if self.class_re is not None and not self.class_re.search(attrs.get('class', '')):
+            return False
+        return self.href_re is None or bool(self.href_re.search(attrs.get('href', '')))
+
+class ExtractionRule:
+    """قاعدة استخراج واحدة مع معدل إصابتها (متوسط متحرك أسي يبدأ من 0.5)"""
+    __slots__ = ('name', 'order', 'fallback', 'selector', 'within', 'pattern', 'rebuild_query',
+                 'score', 'attempts', 'hits')
+    
+    def __init__(self, spec: Dict[str, Any], order: int):
+        unknown = set(spec) - _RULE_KEYS
+        if unknown:
+            raise ValueError(f"rule {spec.get('name')!r} has unknown keys {sorted(unknown)}")
+        if not spec.get('name'):
+            raise ValueError("every rule needs a name")
+        self.name = spec['name']
+        self.order = order
+        self.fallback = bool(spec.get('fallback'))
+        self.selector = TagSelector.compile(spec)
+        self.within = TagSelector.compile(spec['within'], tag=None) if spec.get('within') else None
+        self.pattern = re.compile(spec['pattern']) if spec.get('pattern') else None
+        self.rebuild_query = bool(spec.get('rebuild_query'))
+        if self.selector.empty and self.within is None and self.pattern is None and not self.rebuild_query:
+            raise ValueError(f"rule {self.name!r} matches nothing specific")
+        self.score = 0.5
+        self.attempts = 0
+        self.hits = 0
+    
+    def record(self, hit: bool):
+        self.attempts += 1
+        self.hits += hit
+        self.score += EXTRACTION_RULE_DECAY * (hit - self.score)
+    
+    def rank_key(self) -> Tuple[bool, float, int]:
+        return self.fallback, -self.score, self.order
+
+class RuleProfile:
+    """قواعد موقع واحد: لكل حقل قائمة قواعد مرتبة حسب معدل الإصابة الحالي"""
+    def __init__(self, spec: Dict[str, Any]):
+        self.name = spec['name']
+        self.hosts = [re.compile(pattern, re.I) for pattern in spec.get('hosts', [])]
+        self.fields: Dict[str, List[ExtractionRule]] = {}
+        for field, rules in spec.get('fields', {}).items():
+            if field not in RULE_FIELDS:
+                raise ValueError(f"profile {self.name!r} has unknown field {field!r}")
+            compiled = [ExtractionRule(rule, order) for order, rule in enumerate(rules)]
+            if len({rule.name for rule in compiled}) != len(compiled):
+                raise ValueError(f"profile {self.name!r} repeats a rule name in {field!r}")
+            self.fields[field] = compiled
+    
+    def matches_host(self, host: str) -> bool:
+        return any(pattern.search(host) for pattern in self.hosts)
+
+class SiteRules:
+    """جدول قواعد الاستخراج مع إعادة تحميله من الملف دون إعادة تشغيل البوت"""
+    def __init__(self, path: str, check_interval: float):
+        self.path = path
+        self.check_interval = check_interval
+        self.profiles = self.compile(DEFAULT_EXTRACTION_RULES)
+        self.source = 'builtin'
+        self._mtime: Optional[float] = None
+        self._checked = float('-inf')
+        self.stats = {'reloads': 0, 'reload_errors': 0}
+    
+    @staticmethod
+    def compile(table: Dict[str, Any]) -> List[RuleProfile]:
+        profiles = [RuleProfile(spec) for spec in table.get('profiles', [])]
+        if not profiles:
+            raise ValueError("no profiles defined")
+        return profiles
+    
+    def _stat(self) -> Optional[float]:
+        try:
+            return os.stat(self.path).st_mtime
+        except OSError:
+            return None
+    
+    def reload(self) -> str:
+        """قراءة الملف (أو القواعد المدمجة إن حُذف) واستبدال الجدول دفعة واحدة"""
+        self._checked = time.monotonic()
+        # يُحفظ قبل التحليل حتى لا يُعاد قراءة ملف معطوب في كل فحص
+        self._mtime = self._stat()
+        try:
+            if self._mtime is None:
+                profiles, source = self.compile(DEFAULT_EXTRACTION_RULES), 'builtin'
+            else:
+                with open(self.path, encoding='utf-8') as f:
+                    profiles, source = self.compile(json.load(f)), self.path
+        except (OSError, ValueError, TypeError, KeyError, AttributeError, re.error) as e:
+            self.stats['reload_errors'] += 1
+            raise ValueError(f"{self.path}: {e}") from e
+        # الترتيب يبدأ من جديد بترتيب الملف حتى تسري القاعدة الجديدة من أول طلب
+        self.profiles, self.source = profiles, source
+        self.stats['reloads'] += 1
+        return source
+    
+    def maybe_reload(self):
+        """فحص تاريخ تعديل الملف كل EXTRACTION_RULES_CHECK_INTERVAL (يشمل عمليات الاستخراج)"""
+        now = time.monotonic()
+        if now - self._checked < self.check_interval:
+            return
+        self._checked = now
+        if self._stat() == self._mtime:
+            return
+        try:
+            logger.info(f"Extraction rules reloaded from {self.reload()}")
+        except ValueError as e:
+            logger.warning(f"Keeping previous extraction rules: {e}")
+    
+    def profile_for(self, url: str) -> RuleProfile:
+        host = urlparse(url).netloc.lower() if url else ''
+        default = None
+        for profile in self.profiles:
+            if not profile.hosts:
+                default = default or profile
+            elif host and profile.matches_host(host):
+                return profile
+        return default or self.profiles[0]
+    
+    def first(self, field: str, page: HtmlPage, apply: Callable[[ExtractionRule, HtmlPage, str], Any]):
+        """تجربة قواعد الحقل بترتيب معدل الإصابة وإرجاع أول نتيجة"""
+        self.maybe_reload()
+        rules = self.profile_for(page.url).fields.get(field, [])
+        result = None
+        for rule in rules:
+            result = apply(rule, page, field)
+            rule.record(bool(result))
+            if result:
+                break
+        rules.sort(key=ExtractionRule.rank_key)
+        return result or None
+    
+    def summary(self) -> List[str]:
+        rows = []
+        for profile in self.profiles:
+            rows.append(f"[{profile.name}] {' '.join(p.pattern for p in profile.hosts) or '*'}")
+            for field, rules in profile.fields.items():
+                rows.append(f" {field}")
+                for rule in rules:
+                    rows.append(f"  {rule.name[:20]:<20}{rule.score:>5.2f} {rule.hits}/{rule.attempts}")
+        return rows
+
+site_rules = SiteRules(EXTRACTION_RULES_PATH, EXTRACTION_RULES_CHECK_INTERVAL)
+
+# ----------------- محركات استخراج HTML -----------------
+class ServerLink(NamedTuple):
+    """رابط سيرفر من صفحة الجودات"""
+    href: str
+    text: str
+    data_quality: Optional[str]
+
+class HtmlPage:
+    """صفحة HTML مع تحليل كسول (lxml / BeautifulSoup) عند الحاجة فقط"""
+    __slots__ = ('text', 'url', '_tree', '_soup', '_raw_spans')
+    
+    def __init__(self, text: str, url: str = ''):
+        self.text = text
+        self.url = url
+        self._tree = None
+        self._soup = None
+        self._raw_spans = None
+    
+    @property
+    def raw_spans(self) -> List[Tuple[int, int]]:
+        """مواضع التعليقات ومحتوى script/style التي يجب تجاهلها في المسارات السريعة"""
+        if self._raw_spans is None:
+            self._raw_spans = [match.span() for match in _RAW_TEXT_RE.finditer(self.text)]
+        return self._raw_spans
+    
+    @property
+    def tree(self):
+        if self._tree is None:
+            import lxml.html
+            try:
+                self._tree = lxml.html.fromstring(self.text)
+            except (ValueError, lxml.etree.ParserError):
+                self._tree = False
+        return self._tree
+    
+    @property
+    def soup(self) -> BeautifulSoup:
+        if self._soup is None:
+            from bs4 import BeautifulSoup
+            self._soup = BeautifulSoup(self.text, 'html.parser')
+        return self._soup
+
+DOWNLOAD_CLASS_RE = re.compile(r'download__btn|downloadBTn')
+MP4_HREF_RE = re.compile(r'\.mp4')
+FILE_SIZE_RE = re.compile(r'الحجم[:\s\-–]*([\d\.,]+\s*(?:MB|GB))')
+QUALITY_TEXT_RE = re.compile(r'(\d{3,4}p)')
+
+_OPEN_TAG_RE = re.compile(r'<([a-zA-Z][a-zA-Z0-9]*)\b([^>]*)>')
+_ATTR_RE = re.compile(r'([^\s"\'>/=]+)(?:\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s"\'>]+)))?')
+_ANCHOR_RE = re.compile(r'<a\b([^>]*)>', re.I)
+# التعليقات ومحتوى script/style لا تحتوي عناصر حقيقية (التعليق غير المغلق يمتد لنهاية الصفحة)
+_RAW_TEXT_RE = re.compile(r'<!--.*?(?:-->|\Z)|<(script|style)\b[^>]*>.*?</\1\s*>', re.I | re.S)
+# عناصر بلا محتوى لا يمكن أن تكون أباً لعنصر آخر
+VOID_TAGS = frozenset(('area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr'))
+_TITLE_CENTERAL_RE = re.compile(r'<([a-zA-Z][a-zA-Z0-9]*)\b[^>]*\bclass\s*=\s*["\'][^"\']*\bTitleCenteral\b[^>]*>')
+_H3_RE = re.compile(r'<h3\b[^>]*>(.*?)</h3\s*>', re.I | re.S)
+_SPAN_RE = re.compile(r'<span\b[^>]*>(.*?)</span\s*>', re.I | re.S)
+_STRIP_TAGS_RE = re.compile(r'<[^>]*>')
+
+def _parse_attrs(raw: str) -> Dict[str, str]:
+    """تحليل خصائص الوسم من النص الخام"""
+    attrs = {}
+    for match in _ATTR_RE.finditer(raw):
+        name = match.group(1).lower()
+        if name in attrs:
+            continue
+        value = match.group(2) if match.group(2) is not None else match.group(3) if match.group(3) is not None else match.group(4)
+        attrs[name] = html.unescape(value) if value else ''
+    return attrs
+
+def _inner_text(fragment: str) -> str:
+    """نص العنصر بدون الوسوم"""
+    return html.unescape(_STRIP_TAGS_RE.sub('', fragment)).strip()
+
+def _has_class(attrs: Dict[str, str], name: str) -> bool:
+    return name in attrs.get('class', '').split()
+
+class FastExtractor:
+    """مسارات سريعة بتعابير منتظمة دون بناء شجرة كاملة (الروابط حسب site_rules)"""
+    name = 'fast'
+    
+    @staticmethod
+    def _in_raw_text(page: HtmlPage, pos: int) -> bool:
+        """هل الموضع داخل تعليق أو script/style"""
+        spans = page.raw_spans
+        index = bisect.bisect_right(spans, (pos, len(page.text))) - 1
+        return index >= 0 and spans[index][1] > pos
+    
+    def _anchors(self, page: HtmlPage, needle: Optional[str] = None):
+        """وسوم <a> خارج التعليقات والسكربتات (الخصائص تُحلل فقط إذا احتوت على needle)"""
+        for match in _ANCHOR_RE.finditer(page.text):
+            if needle is not None and needle not in match.group(1):
+                continue
+            if self._in_raw_text(page, match.start()):
+                continue
+            yield match, _parse_attrs(match.group(1))
+    
+    def _anchor_text(self, text: str, match: re.Match) -> str:
+        end = text.find('</a', match.end())
+        return ' '.join(_inner_text(text[match.end():end if end != -1 else len(text)]).split())
+    
+    def download_page_url(self, page: HtmlPage) -> Optional[str]:
+        return site_rules.first('download_page_url', page, self.apply_rule)
+    
+    def apply_rule(self, rule: ExtractionRule, page: HtmlPage, field: str):
+        """تطبيق قاعدة واحدة: كل الروابط المطابقة لحقل server_links وأول رابط لغيره"""
+        if rule.rebuild_query:
+            return self._rebuild_query(page)
+        text = page.text
+        links = []
+        for href, match in self._rule_matches(rule, page):
+            if field != 'server_links':
+                return href
+            if match is None:
+                links.append(ServerLink(href, '', None))
+            else:
+                links.append(ServerLink(href, self._anchor_text(text, match), self._enclosing_quality(page, match.start())))
+        return links or None
+    
+    def _rule_matches(self, rule: ExtractionRule, page: HtmlPage):
+        """الروابط المطابقة للقاعدة مع وسم <a> الخاص بكل منها (None لأنماط النص)"""
+        if rule.pattern is not None:
+            for match in rule.pattern.finditer(page.text):
+                yield html.unescape(match.group(1) if rule.pattern.groups else match.group(0)), None
+            return
+        anchors = self._anchors(page, rule.selector.needle) if rule.within is None else self._anchors_within(page, rule.within)
+        for match, attrs in anchors:
+            href = attrs.get('href')
+            if href and rule.selector.matches(attrs):
+                yield href, match
+    
+    def _anchors_within(self, page: HtmlPage, container: TagSelector):
+        """وسوم <a> داخل كل عنصر يطابق container"""
+        text = page.text
+        for open_match in _OPEN_TAG_RE.finditer(text):
+            if container.tag and open_match.group(1).lower() != container.tag:
+                continue
+            if container.needle is not None and container.needle not in open_match.group(2):
+                continue
+            if self._in_raw_text(page, open_match.start()) or not container.matches(_parse_attrs(open_match.group(2))):
+                continue
+            end = self._element_end(text, open_match)
+            for match in _ANCHOR_RE.finditer(text, open_match.end(), end):
+                if not self._in_raw_text(page, match.start()):
+                    yield match, _parse_attrs(match.group(1))
+    
+    def _rebuild_query(self, page: HtmlPage) -> Optional[str]:
+        """إنشاء رابط التحميل ديناميكياً من معاملات الاستعلام الظاهرة في الصفحة"""
+        if not page.url:
+            return None
+        params = []
+        for q in _QUERY_PARAM_RE.findall(page.text):
+            normalized_param = q.lstrip('?&')
+            if normalized_param.lower().startswith('r='):
+                continue
+            param_name = normalized_param.split('=', 1)[0]
+            if not any(p.startswith(param_name + '=') for p in params):
+                params.append(normalized_param)
+        if not params:
+            return None
+        sep = '&' if '?' in page.url else '?'
+        return page.url + sep + '&'.join(params)
+    
+    def _enclosing_quality(self, page: HtmlPage, pos: int) -> Optional[str]:
+        """قيمة data-quality لأقرب عنصر أب مفتوح قبل الموضع"""
+        text = page.text
+        search_end = pos
+        while True:
+            attr_pos = text.rfind('data-quality', 0, search_end)
+            if attr_pos == -1:
+                return None
+            tag_start = text.rfind('<', 0, attr_pos)
+            open_match = _OPEN_TAG_RE.match(text, tag_start)
+            search_end = tag_start
+            if not open_match or self._in_raw_text(page, tag_start):
+                continue
+            # العناصر الفارغة (img وغيرها) والوسوم المغلقة ذاتياً ليست آباء
+            if open_match.group(1).lower() in VOID_TAGS or open_match.group(2).rstrip().endswith('/'):
+                continue
+            if self._element_end(text, open_match) > pos:
+                return _parse_attrs(open_match.group(2)).get('data-quality')
+    
+    def server_links(self, page: HtmlPage) -> List[ServerLink]:
+        return site_rules.first('server_links', page, self.apply_rule) or []
+    
+    def button_href(self, page: HtmlPage) -> Optional[str]:
+        return site_rules.first('button_href', page, self.apply_rule)
+    
+    def final_link(self, page: HtmlPage) -> Optional[str]:
+        return site_rules.first('final_link', page, self.apply_rule)
+    
+    def file_meta(self, page: HtmlPage) -> Tuple[Optional[str], Optional[str]]:
+        text = page.text
+        file_name = file_size = None
+        
+        container = _TITLE_CENTERAL_RE.search(text)
+        if container:
+            headings = _H3_RE.findall(text, container.end(), self._element_end(text, container))
+            spans = [_SPAN_RE.search(h3) for h3 in headings[:2]]
+            if spans and spans[0]:
+                file_name = _inner_text(spans[0].group(1))
+            if len(spans) > 1 and spans[1]:
+                file_size = _inner_text(spans[1].group(1))
+        
+        if not file_size:
+            h3 = _H3_RE.search(text)
+            if h3:
+                msize = FILE_SIZE_RE.search(_inner_text(h3.group(1)))
+                if msize:
+                    file_size = msize.group(1)
+        
+        return file_name or None, file_size or None
+    
+    @staticmethod
+    def _element_end(text: str, open_match: re.Match) -> int:
+        """موضع نهاية العنصر المطابق لوسم الفتح"""
+        pattern = re.compile(rf'<(/?){open_match.group(1)}\b[^>]*>', re.I)
+        depth = 1
+        for match in pattern.finditer(text, open_match.end()):
+            depth += -1 if match.group(1) else 1
+            if depth == 0:
+                return match.start()
+        return len(text)
+
+_CLASS_XPATH = "contains(concat(' ', normalize-space(@class), ' '), ' {} ')"
+
+class LxmlExtractor:
+    """استخراج عبر شجرة lxml (أسرع بكثير من html.parser)"""
+    name = 'lxml'
+    
+    def download_page_url(self, page: HtmlPage) -> Optional[str]:
+        tree = page.tree
+        if tree is False:
+            return None
+        hrefs = tree.xpath("//a[contains(@href, '/download/')]/@href")
+        if hrefs:
+            return hrefs[0]
+        for a in tree.xpath("//a[@class and @href]"):
+            if DOWNLOAD_CLASS_RE.search(a.get('class')):
+                return a.get('href')
+        return None
+    
+    def server_links(self, page: HtmlPage) -> List[ServerLink]:
+        tree = page.tree
+        if tree is False:
+            return []
+        anchors = tree.xpath("//a[contains(@href, '/l/')]")
+        if not anchors:
+            anchors = tree.xpath(f"//ul[{_CLASS_XPATH.format('downloads__links__list')}]//a[@href]")
+        links = []
+        for a in anchors:
+            quality = a.xpath("ancestor::*[@data-quality][1]/@data-quality")
+            links.append(ServerLink(a.get('href'), ' '.join(a.text_content().split()), quality[0] if quality else None))
+        return links
+    
+    def button_href(self, page: HtmlPage) -> Optional[str]:
+        tree = page.tree
+        if tree is False:
+            return None
+        tags = tree.xpath("//a[@id='btn']") or tree.xpath(f"//a[{_CLASS_XPATH.format('downloadbtn')}]")
+        return tags[0].get('href') or None if tags else None
+    
+    def final_link(self, page: HtmlPage) -> Optional[str]:
+        tree = page.tree
+        if tree is False:
+            return None
+        tags = (tree.xpath("//a[@id='btn']") or
+                tree.xpath(f"//a[{_CLASS_XPATH.format('downloadbtn')}]") or
+                tree.xpath("//a[contains(@href, '.mp4')]"))
+        return tags[0].get('href') or None if tags else None
+    
+    def file_meta(self, page: HtmlPage) -> Tuple[Optional[str], Optional[str]]:
+        tree = page.tree
+        if tree is False:
+            return None, None
+        container = f"//*[{_CLASS_XPATH.format('TitleCenteral')}]"
+        name_span = tree.xpath(f"{container}//h3//span")
+        size_span = tree.xpath(f"{container}//h3[count(preceding-sibling::h3) = 1]//span")
+        file_name = name_span[0].text_content().strip() if name_span else None
+        file_size = size_span[0].text_content().strip() if size_span else None
+        
+        if not file_size:
+            h3 = tree.xpath("(//h3)[1]")
+            if h3:
+                msize = FILE_SIZE_RE.search(h3[0].text_content())
+                if msize:
+                    file_size = msize.group(1)
+        
+        return file_name or None, file_size or None
+
+class SoupExtractor:
+    """منطق BeautifulSoup الأصلي كخيار احتياطي أخير"""
+    name = 'soup'
+    
+    def download_page_url(self, page: HtmlPage) -> Optional[str]:
+        soup = page.soup
+        anchor = soup.find('a', href=re.compile(r'/download/')) or soup.find('a', class_=DOWNLOAD_CLASS_RE)
+        return anchor.get('href') if anchor else None
+    
+    def server_links(self, page: HtmlPage) -> List[ServerLink]:
+        soup = page.soup
+        anchors = soup.find_all('a', href=re.compile(r'/l/'))
+        if not anchors:
+            anchors = soup.select('ul.downloads__links__list a')
+        links = []
+        for a in anchors:
+            if not a.get('href'):
+                continue
+            parent_with_quality = a.find_parent(attrs={"data-quality": True})
+            quality = parent_with_quality.get('data-quality') if parent_with_quality else None
+            links.append(ServerLink(a.get('href'), a.get_text(" ", strip=True), quality))
+        return links
+    
+    def button_href(self, page: HtmlPage) -> Optional[str]:
+        soup = page.soup
+        btn_tag = soup.find('a', id='btn') or soup.select_one('a.downloadbtn')
+        return btn_tag.get('href') or None if btn_tag else None
+    
+    def final_link(self, page: HtmlPage) -> Optional[str]:
+        soup = page.soup
+        final_tag = (soup.find('a', id='btn') or
+                     soup.find('a', class_='downloadbtn') or
+                     soup.find('a', href=MP4_HREF_RE))
+        return final_tag.get('href') or None if final_tag else None
+    
+    def file_meta(self, page: HtmlPage) -> Tuple[Optional[str], Optional[str]]:
+        soup = page.soup
+        file_name = file_size = None
+        
+        name_span = soup.select_one('.TitleCenteral h3 span')
+        if name_span:
+            file_name = name_span.get_text(strip=True)
+        
+        size_span = soup.select_one('.TitleCenteral h3:nth-of-type(2) span')
+        if size_span:
+            file_size = size_span.get_text(strip=True)
+        
+        if not file_size:
+            h3 = soup.find('h3')
+            if h3:
+                msize = FILE_SIZE_RE.search(h3.get_text())
+                if msize:
+                    file_size = msize.group(1)
+        
+        return file_name or None, file_size or None
+
+EXTRACTOR_BACKENDS = {cls.name: cls for cls in (FastExtractor, LxmlExtractor, SoupExtractor)}
+
+class ExtractorChain:
+    """سلسلة محركات الاستخراج: أول نتيجة غير فارغة تُعتمد"""
+    def __init__(self, names: List[str]):
+        self.backends = [EXTRACTOR_BACKENDS[name]() for name in names if name in EXTRACTOR_BACKENDS]
+        if not self.backends:
+            self.backends = [SoupExtractor()]
+        self.hits = {backend.name: 0 for backend in self.backends}
+        self.misses = 0
+    
+    def _first(self, method: str, page: HtmlPage):
+        with metrics.stage('parse') as timer:
+            timer.bytes = len(page.text)
+            for backend in self.backends:
+                result = getattr(backend, method)(page)
+                if result and result != (None, None):
+                    self.hits[backend.name] += 1
+                    timer.outcome = backend.name
+                    return result
+            self.misses += 1
+            timer.outcome = 'miss'
+            return None
+    
+    def download_page_url(self, page: HtmlPage) -> Optional[str]:
+        return self._first('download_page_url', page)
+    
+    def server_links(self, page: HtmlPage) -> List[ServerLink]:
+        return self._first('server_links', page) or []
+    
+    def button_href(self, page: HtmlPage) -> Optional[str]:
+        return self._first('button_href', page)
+    
+    def final_link(self, page: HtmlPage) -> Optional[str]:
+        return self._first('final_link', page)
+    
+    def file_meta(self, page: HtmlPage) -> Tuple[Optional[str], Optional[str]]:
+        return self._first('file_meta', page) or (None, None)
+
+extractor = ExtractorChain([name.strip() for name in HTML_EXTRACTORS.split(',')])
+
+# ----------------- القراءة المتدفقة للصفحات -----------------
+NOT_FOUND_RE = re.compile(r'لم يتم العثور|page not found|صفحة غير موجودة', re.I)
+# أنماط التوقف تشترط اكتمال الوسم/الرابط حتى لا يُقطع عند حدود الدفعات
+DOWNLOAD_ANCHOR_RE = re.compile(r'<a\b[^>]*href\s*=\s*["\'][^"\']*/download/[^>]*>', re.I)
+R_LINK_RE = re.compile(r'(https?://[^"\'>\s]+/category/downloadz/\?r=\d+[^"\'>\s]*)')
+R_LINK_STOP_RE = re.compile(R_LINK_RE.pattern + r'["\'>\s]')
+BTN_ANCHOR_RE = re.compile(r'<a\b[^>]*\bid\s*=\s*["\']?btn\b[^>]*>', re.I)
+TITLE_SIZE_RE = re.compile(r'TitleCenteral.*?<h3\b.*?</h3\s*>.*?<h3\b.*?</h3\s*>', re.S | re.I)
+
+class FetchedPage(NamedTuple):
+    """نتيجة جلب صفحة (قد تكون جزئية عند التوقف المبكر)"""
+    status: int
+    url: str
+    text: str
+    size: int
+    complete: bool
+    aborted: bool
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+async def fetch_page(session: aiohttp.ClientSession, url: str, headers: Optional[dict] = None,
+                     until: Tuple[re.Pattern, ...] = (), abort_on: Optional[re.Pattern] = None,
+                     max_bytes: int = MAX_PAGE_BYTES, stage: str = 'page', **kwargs) -> FetchedPage:
+    """قراءة الصفحة على دفعات والتوقف فور العثور على كل الأنماط المطلوبة أو تجاوز الحد الأقصى للحجم"""
+    async def fetch(target: str) -> FetchedPage:
+        with metrics.stage(stage, target) as timer:
+            # نفاد الميزانية ليس خطأً من المضيف فيُحسب خارج try
+            timeout = kwargs.get('timeout') or stage_timeouts.client_timeout(stage)
+            started = time.perf_counter()
+            try:
+                page = await _fetch_page(session, target, headers, until, abort_on, max_bytes,
+                                         **dict(kwargs, timeout=timeout))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                host_health.record(target, time.perf_counter() - started, False)
+                raise
+            host_health.record(target, time.perf_counter() - started, page.status < 500)
+            timer.bytes = page.size
+            timer.outcome = ('aborted' if page.aborted else 'early' if not page.complete and page.size < max_bytes
+                             else 'truncated' if not page.complete else str(page.status))
+            return page
+    
+    return await with_retries(stage, lambda: hedged(host_health.rewrite(url), fetch),
+                              retry_if=lambda page: page.status in RETRY_STATUSES)
+
+async def _fetch_page(session: aiohttp.ClientSession, url: str, headers: Optional[dict], until: Tuple[re.Pattern, ...],
+                      abort_on: Optional[re.Pattern], max_bytes: int, **kwargs) -> FetchedPage:
+    async with session.get(url, headers=headers, **kwargs) as response:
+        if response.status >= 400:
+            return FetchedPage(response.status, str(response.url), '', 0, False, False,
+                               response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        
+        decoder = codecs.getincrementaldecoder(response.charset or 'utf-8')(errors='replace')
+        parts = []
+        pending = list(until)
+        tail = ''
+        size = 0
+        complete = True
+        aborted = False
+        
+        async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+            size += len(chunk)
+            truncated = size > max_bytes
+            if truncated:
+                chunk = chunk[:len(chunk) - (size - max_bytes)]
+                size = max_bytes
+            
+            piece = decoder.decode(chunk)
+            parts.append(piece)
+            # البحث في الجزء الجديد مع تداخل بسيط مع الجزء السابق
+            window = tail + piece
+            tail = window[-STREAM_MATCH_OVERLAP:]
+            
+            if abort_on is not None and abort_on.search(window):
+                aborted = True
+            pending = [pattern for pattern in pending if not pattern.search(window)]
+            
+            if aborted or (until and not pending) or truncated:
+                if truncated:
+                    logger.warning(f"Page {url} exceeded {max_bytes} bytes, truncated")
+                complete = False
+                break
+        else:
+            parts.append(decoder.decode(b'', final=True))
+        
+        if not complete:
+            # إغلاق الاتصال بدلاً من قراءة بقية الصفحة
+            response.close()
+        
+        return FetchedPage(response.status, str(response.url), ''.join(parts), size, complete, aborted,
+                           response.headers.get('ETag'), response.headers.get('Last-Modified'))
+
+# ----------------- دوال الاستخراج الرئيسية -----------------
+EPISODE_NOT_FOUND_MSG = "❌ الحلقة غير موجودة!"
+
+def is_episode_not_found(message: str) -> bool:
+    """هل فشلت المعالجة لأن الحلقة غير موجودة"""
+    return message == EPISODE_NOT_FOUND_MSG or message.endswith("(رمز: 404)")
+
+async def get_download_info(server_href: str, referer: str) -> Optional[Dict]:
+    """استخراج معلومات التحميل من رابط السيرفر"""
+    try:
+        session = http_client.session
+        headers = {"Referer": referer}
+        
+        # تتبع إعادة التوجيه
+        redirected = await follow_redirect(server_href, session, headers=headers)
+        if not redirected:
+            return None
+        
+        # البحث عن رابط ?r=
+        r_link = None
+        if '?r=' in redirected:
+            r_link = redirected
         else:
-            self.processing_users.discard(user_id)
+            page = await fetch_page(session, redirected, headers=headers, until=(R_LINK_STOP_RE,), stage='server')
+            match = R_LINK_RE.search(page.text)
+            if match:
+                r_link = match.group(1)
+            elif '?r=' in page.url:
+                r_link = page.url
+        
+        if not r_link:
+            return None
+        
+        # تحليل صفحة التحميل
+        page = await fetch_page(session, r_link, headers=headers, until=(BTN_ANCHOR_RE,), stage='rlink')
+        
+        # البحث عن زر التحميل (أو إنشاء الرابط من معاملات الصفحة عبر قاعدة query-rebuild)
+        final_asd_url = extractor.button_href(HtmlPage(page.text, r_link))
+        if final_asd_url and final_asd_url.startswith('/'):
+            final_asd_url = extract_base_url(r_link) + final_asd_url
+        
+        if not final_asd_url:
+            final_asd_url = r_link
+        
+        # الحصول على الرابط النهائي
+        final_fetch = await fetch_page(session, final_asd_url, headers=headers, until=(BTN_ANCHOR_RE, TITLE_SIZE_RE), stage='final')
+        final_page = HtmlPage(final_fetch.text, final_fetch.url)
+        
+        # البحث عن رابط MP4
+        file_link = extractor.final_link(final_page)
+        if not file_link:
+            return None
+        
+        if file_link.startswith('/'):
+            file_link = extract_base_url(final_asd_url) + file_link
+        
+        # استخراج اسم الملف وحجمه
+        file_name, file_size = extractor.file_meta(final_page)
+        
+        if not file_name:
+            file_name = os.path.basename(file_link) if file_link else "unknown"
+        
+        return {
+            'direct_link': file_link.replace(" ", ".") if file_link else None,
+            'file_name': file_name,
+            'file_size': file_size or "Unknown"
+        }
+
+    except Exception as e:
+        logger.error(f"Error in get_download_info: {e}")
+        return None
+
+# ----------------- فحص الروابط المباشرة -----------------
+class LinkProbe(NamedTuple):
+    """نتيجة فحص رابط مباشر (status=0 عند تعذر الفحص)"""
+    alive: bool
+    size: Optional[int]
+    status: int
+
+CONTENT_RANGE_TOTAL_RE = re.compile(r'/\s*(\d+)\s*$')
+
+def format_size(nbytes: int) -> str:
+    """تنسيق الحجم بنفس أسلوب الموقع (MB / GB)"""
+    if nbytes >= 1024 ** 3:
+        return f"{nbytes / 1024 ** 3:.2f} GB"
+    return f"{nbytes / 1024 ** 2:.0f} MB"
+
+async def _probe_link(url: str, referer: Optional[str]) -> LinkProbe:
+    headers = {'Referer': referer} if referer else {}
+    session = http_client.session
+    with metrics.stage('probe', url) as timer:
+        try:
+            async with session.head(url, headers=headers, allow_redirects=True,
+                                    timeout=stage_timeouts.client_timeout('probe')) as response:
+                timer.outcome = f"HEAD {response.status}"
+                if response.status < 400 and response.content_length:
+                    return LinkProbe(True, response.content_length, response.status)
+                if response.status in (404, 410):
+                    return LinkProbe(False, None, response.status)
+            # بعض الخوادم لا تدعم HEAD أو لا تعيد الحجم: طلب أول بايت فقط
+            async with session.get(url, headers=dict(headers, Range='bytes=0-0'), allow_redirects=True,
+                                   timeout=stage_timeouts.client_timeout('probe')) as response:
+                timer.outcome = f"RANGE {response.status}"
+                if response.status >= 400:
+                    return LinkProbe(False, None, response.status)
+                match = CONTENT_RANGE_TOTAL_RE.search(response.headers.get('Content-Range', ''))
+                size = int(match.group(1)) if match else response.content_length if response.status == 200 else None
+                return LinkProbe(True, size, response.status)
+        except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+            # تعذر الفحص لا يعني أن الرابط معطل
+            logger.warning(f"Could not probe {url}: {e}")
+            return LinkProbe(True, None, 0)
+
+async def probe_link(url: str, referer: Optional[str] = None) -> LinkProbe:
+    """فحص الرابط المباشر عبر الكاش (الروابط المعطلة تُحفظ لمدة أقصر)"""
+    return await probe_cache.get_or_resolve(
+        url,
+        lambda: _probe_link(url, referer),
+        cacheable=lambda probe: probe.status != 0,
+        ttl_of=lambda probe: PROBE_CACHE_TTL if probe.alive else PROBE_DEAD_TTL,
+    )
+
+async def resolve_live_link(server_href: str, referer: str) -> Optional[Dict]:
+    """استخراج رابط الجودة والتأكد من أنه يعمل (مع إعادة الاستخراج مرة واحدة إذا كان معطلاً)"""
+    for attempt in range(2):
+        info = await get_download_info(server_href, referer)
+        if not info or not info.get('direct_link') or not PROBE_LINKS:
+            return info
+        probe = await probe_link(info['direct_link'], referer)
+        if probe.alive:
+            if probe.size:
+                info['file_size'] = format_size(probe.size)
+            info['checked_at'] = time.time()
+            # يُحفظ لإعادة الفحص لاحقاً بنفس الترويسة (بعض المضيفين يرفضون الطلب بدونها)
+            info['referer'] = referer
+            return info
+        logger.warning(f"Dead direct link (HTTP {probe.status}) from {server_href}, attempt {attempt + 1}")
+    return None
+
+async def links_alive(qualities: List[Dict]) -> bool:
+    """إعادة فحص الروابط المحفوظة التي مضى على فحصها أكثر من PROBE_CACHE_TTL"""
+    stale = [info for info in qualities if time.time() - info.get('checked_at', 0) > PROBE_CACHE_TTL]
+    if not PROBE_LINKS or not stale:
+        return True
+    probes = await asyncio.gather(*(probe_link(info['direct_link'], info.get('referer')) for info in stale))
+    for info, probe in zip(stale, probes):
+        info['checked_at'] = time.time()
+    return all(probe.alive for probe in probes)
+
+def quality_sort_key(quality: str) -> int:
+    """ترتيب الجودات من الأعلى إلى الأقل (المجهولة في النهاية)"""
+    match = re.search(r'(\d{3,4})', quality or '')
+    return -int(match.group(1)) if match else 0
+
+async def resolve_qualities(candidates: List[Tuple[str, str]], referer: str) -> List[Tuple[str, Dict]]:
+    """استخراج روابط الجودات بالتوازي مع مهلة إجمالية للصفحة"""
+    if not RESOLVE_CONCURRENTLY:
+        results = []
+        for quality, href in candidates:
+            info = await resolve_live_link(href, referer)
+            if info and info.get('direct_link'):
+                results.append((quality, info))
+        return results
+    
+    semaphore = asyncio.Semaphore(QUALITY_CONCURRENCY)
+    
+    async def resolve_one(href: str) -> Optional[Dict]:
+        async with semaphore:
+            return await resolve_live_link(href, referer)
+    
+    tasks = [asyncio.create_task(resolve_one(href)) for _, href in candidates]
+    if not tasks:
+        return []
+    
+    # الجودات التي تفشل أو تتجاوز الميزانية تُحذف دون إلغاء الجودات الناجحة (نتيجة جزئية)
+    wait_for = max(0.0, remaining_budget() - REPLY_RESERVE)
+    done, pending = await asyncio.wait(tasks, timeout=wait_for)
+    for task in pending:
+        task.cancel()
+    if pending:
+        logger.warning(f"Dropped {len(pending)} quality server(s) after {wait_for:.1f}s of request budget")
+    
+    results = []
+    for index, ((quality, _), task) in enumerate(zip(candidates, tasks)):
+        if task not in done or task.cancelled() or task.exception():
+            continue
+        info = task.result()
+        if info and info.get('direct_link'):
+            results.append((quality_sort_key(quality), index, quality, info))
+    
+    results.sort(key=lambda item: (item[0], item[1]))
+    return [(quality, info) for _, _, quality, info in results]
+
+def resolution_failure(message: str) -> Dict:
+    """نتيجة فاشلة كبيانات بسيطة"""
+    return {'success': False, 'title': message, 'qualities': []}
+
+def build_quality_buttons(qualities: List[Dict]) -> List[List[InlineKeyboardButton]]:
+    """بناء أزرار التحميل من بيانات الجودات"""
+    buttons = []
+    for info in qualities:
+        btn_text = f"📥 {info['quality']} ({info.get('file_size', '?')})"
+        buttons.append([InlineKeyboardButton(btn_text, url=info['direct_link'])])
+    return buttons
+
+def resolution_to_reply(result: Dict) -> Tuple[bool, str, List[List[InlineKeyboardButton]]]:
+    """تحويل نتيجة الاستخراج إلى (نجاح، عنوان، أزرار)"""
+    return result['success'], result['title'], build_quality_buttons(result['qualities'])
+
+async def resolve_episode(url: str, session: aiohttp.ClientSession, budget: float = REQUEST_BUDGET) -> Dict:
+    """معالجة رابط عرب سيد وإرجاع النتيجة كبيانات بسيطة (قابلة للنقل بين العمليات)"""
+    with metrics.stage('resolve', url) as timer, request_deadline(budget):
+        result = await _resolve_episode(url, session)
+        timer.outcome = 'ok' if result['success'] else 'not_found' if is_episode_not_found(result['title']) else 'failed'
+        return result
+
+async def process_arabseed_url(url: str, session: aiohttp.ClientSession) -> Tuple[bool, str, List[List[InlineKeyboardButton]]]:
+    """معالجة رابط عرب سيد"""
+    return resolution_to_reply(await resolve_episode(url, session))
+
+async def _resolve_episode(url: str, session: aiohttp.ClientSession) -> Dict:
+    try:
+        # فحص الرابط
+        if not url.startswith(('http://', 'https://')):
+            return resolution_failure("❌ رابط غير صالح!")
+        
+        # تتبع الروابط المختصرة
+        if '/l/' in url or 'reviewrate.net' in url:
+            url = await follow_redirect(url, session) or url
+        
+        page = await fetch_page(session, url, until=(DOWNLOAD_ANCHOR_RE,), abort_on=NOT_FOUND_RE, stage='episode')
+        if page.status != 200:
+            return resolution_failure(f"❌ الرابط غير متاح (رمز: {page.status})")
+        
+        # التحقق من وجود الصفحة
+        if page.aborted:
+            return resolution_failure(EPISODE_NOT_FOUND_MSG)
+        
+        # البحث عن رابط صفحة التحميل
+        quality_page_url = extractor.download_page_url(HtmlPage(page.text, page.url))
+        if not quality_page_url:
+            return resolution_failure("❌ لم أتمكن من العثور على روابط التحميل!")
+        
+        if quality_page_url.startswith('/'):
+            quality_page_url = extract_base_url(url) + quality_page_url
+        
+        # زيارة صفحة الجودات
+        qpage = await fetch_page(session, quality_page_url, headers={'Referer': extract_base_url(url)}, stage='qualities')
+        if qpage.status != 200:
+            return resolution_failure("❌ صفحة الجودات غير متاحة!")
+        
+        # جمع روابط السيرفرات
+        server_links = extractor.server_links(HtmlPage(qpage.text, qpage.url))
+        
+        if not server_links:
+            return resolution_failure("❌ لا توجد روابط تحميل متاحة!")
+        
+        # جمع السيرفرات (جودة واحدة لكل سيرفر)
+        candidates = []
+        seen_qualities = set()
+        
+        for link in server_links:
+            href = link.href
+            if not href:
+                continue
             
-    def get_session(self, user_id: int) -> dict:
-        if user_id not in self.user_sessions:
-            self.user_sessions[user_id] = {
-                'last_url': None,
-                'last_title': None,
-                'episode_number': None,
-                'auto_mode': False,
-                'history': []
-            }
-        return self.user_sessions[user_id]
+            # تخطي الروابط غير المباشرة
+            if 'arabseed' not in href and 'عرب سيد' not in link.text:
+                continue
+            
+            # تحديد الجودة
+            quality = "Unknown"
+            if link.data_quality is not None:
+                quality = link.data_quality
+            else:
+                qmatch = QUALITY_TEXT_RE.search(link.text)
+                if qmatch:
+                    quality = qmatch.group(1)
+            
+            if quality in seen_qualities:
+                continue
+            seen_qualities.add(quality)
+            candidates.append((quality, href))
+        
+        # استخراج معلومات التحميل لكل جودة
+        resolved = await resolve_qualities(candidates, extract_base_url(quality_page_url))
+        qualities = [dict(info, quality=quality) for quality, info in resolved]
+        
+        if not qualities:
+            return resolution_failure("❌ لم أتمكن من استخراج روابط التحميل!")
+        
+        title = extract_title_from_url(url)
+        return {'success': True, 'title': title, 'qualities': qualities}
 
-storage = Storage()
+    except asyncio.TimeoutError:
+        return resolution_failure("⏰ انتهى الوقت المحدد للطلب!")
+    except Exception as e:
+        logger.error(f"Error processing URL: {e}\n{traceback.format_exc()}")
+        return resolution_failure(f"❌ حدث خطأ أثناء المعالجة: {str(e)}")
+
+# ----------------- عمال الاستخراج (عمليات منفصلة) -----------------
+def worker_telemetry() -> Dict:
+    """مقاييس وعدادات العامل التراكمية لتجمعها الواجهة في /stats و /metrics"""
+    return {
+        'metrics': metrics.export(),
+        'stats': {
+            'http': dict(http_client.stats),
+            'redirect_cache': dict(redirect_cache.stats),
+            'probe_cache': dict(probe_cache.stats),
+            'host_health': dict(host_health.stats),
+            'stage_timeouts': dict(stage_timeouts.stats),
+            'site_rules': dict(site_rules.stats),
+            'sizes': {'redirect_cache': len(redirect_cache), 'probe_cache': len(probe_cache)},
+        },
+    }
+
+def worker_snapshot_path(index: int) -> str:
+    """لقطة كاش التحويلات الخاصة بكل عامل (الكاش يعيش داخل العامل لا في الواجهة)"""
+    path = CACHE_SNAPSHOT_PATH.format(instance=INSTANCE_ID)
+    if not path:
+        return ''
+    root, ext = os.path.splitext(path)
+    return f"{root}.worker{index}{ext}"
+
+async def _serve_resolver(path: str, index: int):
+    """حلقة عامل الاستخراج: يستقبل طلبات JSON عبر unix socket ويعيد النتائج كبيانات بسيطة"""
+    await http_client.start()
+    snapshot = CacheSnapshot(worker_snapshot_path(index), [redirect_cache])
+    await snapshot.start()
+    tasks = set()
+    
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        write_lock = asyncio.Lock()
+        
+        async def work(request: dict):
+            try:
+                result = await resolve_episode(request['url'], http_client.session, request['budget'])
+            except Exception as e:
+                logger.error(f"Resolver worker error: {e}")
+                result = resolution_failure("❌ حدث خطأ أثناء المعالجة")
+            async with write_lock:
+                message = {'id': request['id'], 'result': result, 'telemetry': worker_telemetry()}
+                writer.write(json.dumps(message, ensure_ascii=False).encode() + b'\n')
+                await writer.drain()
+        
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                task = asyncio.create_task(work(json.loads(line)))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except asyncio.CancelledError:
+            # إيقاف العامل أثناء انتظار طلب جديد
+            pass
+    
+    # الواجهة تنهي العامل بـ SIGTERM، فنحفظ لقطة الكاش قبل الخروج
+    stop_event = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop_event.set)
+    server = await asyncio.start_unix_server(handle, path)
+    try:
+        async with server:
+            await stop_event.wait()
+    finally:
+        await snapshot.close()
+        await http_client.close()
+
+def resolver_worker_main(path: str, index: int = 0):
+    """نقطة دخول عملية العامل"""
+    try:
+        asyncio.run(_serve_resolver(path, index))
+    except KeyboardInterrupt:
+        pass
+
+class _ResolverWorker:
+    """اتصال الواجهة بعملية عامل واحدة"""
+    __slots__ = ('index', 'path', 'process', 'reader', 'writer', 'pending', 'reader_task', 'telemetry')
+    
+    def __init__(self, index: int, path: str):
+        self.index = index
+        self.path = path
+        self.process = None
+        self.reader = None
+        self.writer = None
+        self.pending: Dict[int, asyncio.Future] = {}
+        self.reader_task: Optional[asyncio.Task] = None
+        # آخر مقاييس تراكمية وصلت من العامل
+        self.telemetry: Optional[Dict] = None
+
+class ResolverPool:
+    """مجموعة عمليات استخراج تعمل بالتوازي على أنوية المعالج"""
+    def __init__(self, size: int, socket_dir: str = RESOLVER_SOCKET_DIR):
+        self.size = size
+        self.socket_dir = socket_dir
+        self.workers: List[_ResolverWorker] = []
+        self._ids = 0
+        self._closing = False
+        self.stats = {'requests': 0, 'restarts': 0}
+        # عدادات العمال المعاد تشغيلهم حتى لا تتراجع القيم التراكمية
+        self._retired_stats: Dict[str, Dict[str, float]] = {}
+    
+    @property
+    def started(self) -> bool:
+        return bool(self.workers)
+    
+    async def start(self):
+        if self.workers:
+            return
+        self._closing = False
+        for index in range(self.size):
+            path = os.path.join(self.socket_dir, f"arabseed-resolver-{os.getpid()}-{index}.sock")
+            worker = _ResolverWorker(index, path)
+            self.workers.append(worker)
+            await self._spawn(worker)
+        logger.info(f"Started {self.size} resolver worker process(es)")
+    
+    async def _spawn(self, worker: _ResolverWorker):
+        if os.path.exists(worker.path):
+            os.unlink(worker.path)
+        worker.process = multiprocessing.get_context('spawn').Process(
+            target=resolver_worker_main, args=(worker.path, worker.index), daemon=True
+        )
+        worker.process.start()
+        
+        deadline = time.monotonic() + RESOLVER_START_TIMEOUT
+        while True:
+            try:
+                worker.reader, worker.writer = await asyncio.open_unix_connection(worker.path, limit=MAX_PAGE_BYTES)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() > deadline or not worker.process.is_alive():
+                    raise RuntimeError(f"Resolver worker {worker.index} failed to start")
+                await asyncio.sleep(0.05)
+        worker.reader_task = asyncio.create_task(self._read_results(worker))
+    
+    async def _read_results(self, worker: _ResolverWorker):
+        try:
+            while True:
+                line = await worker.reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                worker.telemetry = message['telemetry']
+                metrics.remote[worker.index] = Metrics.from_export(worker.telemetry['metrics'])
+                future = worker.pending.pop(message['id'], None)
+                if future is not None and not future.done():
+                    future.set_result(message['result'])
+        except Exception as e:
+            logger.error(f"Resolver worker {worker.index} connection error: {e}")
+        
+        # انقطع الاتصال: إيقاف توجيه الطلبات للعامل وإنهاء المعلقة ثم إعادة تشغيله
+        if worker.writer is not None:
+            worker.writer.close()
+            worker.writer = None
+        for future in worker.pending.values():
+            if not future.done():
+                future.set_result(resolution_failure("❌ حدث خطأ أثناء المعالجة، حاول مرة أخرى."))
+        worker.pending.clear()
+        if self._closing:
+            return
+        self._retire(worker)
+        logger.warning(f"Resolver worker {worker.index} exited, restarting")
+        self.stats['restarts'] += 1
+        delay = 0.5
+        while not self._closing:
+            worker.process.kill()
+            try:
+                await self._spawn(worker)
+                return
+            except Exception as e:
+                logger.error(f"Resolver worker {worker.index} restart failed, retrying in {delay:.1f}s: {e}")
+                worker.writer = None
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RESOLVER_RESTART_MAX_DELAY)
+    
+    async def resolve(self, url: str, budget: float = REQUEST_BUDGET) -> Dict:
+        """إرسال الرابط للعامل الأقل انشغالاً مع ميزانيته الزمنية (وتجربة عامل آخر إذا انقطع الاتصال)"""
+        tried = set()
+        while True:
+            # العمال قيد إعادة التشغيل (writer = None) لا يستقبلون طلبات
+            ready = [w for w in self.workers if w.writer is not None and w.index not in tried]
+            if not ready:
+                return resolution_failure("❌ حدث خطأ أثناء المعالجة، حاول مرة أخرى.")
+            worker = min(ready, key=lambda w: len(w.pending))
+            tried.add(worker.index)
+            self._ids += 1
+            request_id = self._ids
+            future = asyncio.get_running_loop().create_future()
+            worker.pending[request_id] = future
+            self.stats['requests'] += 1
+            try:
+                worker.writer.write(json.dumps({'id': request_id, 'url': url, 'budget': budget}, ensure_ascii=False).encode() + b'\n')
+                await worker.writer.drain()
+            except (ConnectionError, OSError) as e:
+                # الطلب لم يصل للعامل فيمكن إعادته بأمان على عامل آخر
+                logger.warning(f"Resolver worker {worker.index} unavailable: {e}")
+                worker.pending.pop(request_id, None)
+                continue
+            try:
+                # العامل يلتزم بالميزانية، والمهلة هنا حماية من عامل معلق فقط
+                return await asyncio.wait_for(future, budget + REPLY_RESERVE)
+            except asyncio.TimeoutError:
+                logger.warning(f"Resolver worker {worker.index} exceeded the {budget:.1f}s budget for {url}")
+                return resolution_failure("⏰ انتهى الوقت المحدد للطلب!")
+            finally:
+                worker.pending.pop(request_id, None)
+    
+    def _retire(self, worker: _ResolverWorker):
+        """ضم آخر مقاييس العامل المتوقف إلى الرصيد المتقاعد (العامل الجديد يبدأ من الصفر)"""
+        remote = metrics.remote.pop(worker.index, None)
+        if remote is not None:
+            metrics.remote.setdefault('retired', Metrics()).merge(remote)
+        if worker.telemetry is not None:
+            for name, stats in worker.telemetry['stats'].items():
+                # أحجام الكاش ليست تراكمية وكاش العامل المتوقف ضاع معه
+                if name == 'sizes':
+                    continue
+                retired = self._retired_stats.setdefault(name, {})
+                for key, value in stats.items():
+                    retired[key] = retired.get(key, 0) + value
+        worker.telemetry = None
+    
+    def combined_stats(self, name: str, local: Dict[str, float]) -> Dict[str, float]:
+        """عدادات هذه العملية مضافاً إليها عدادات العمال الحاليين والمتوقفين"""
+        sources = [self._retired_stats.get(name, {})]
+        sources += [worker.telemetry['stats'].get(name, {}) for worker in self.workers if worker.telemetry is not None]
+        combined = dict(local)
+        for stats in sources:
+            for key, value in stats.items():
+                combined[key] = combined.get(key, 0) + value
+        return combined
+    
+    def outstanding(self) -> int:
+        return sum(len(worker.pending) for worker in self.workers)
+    
+    async def close(self):
+        self._closing = True
+        for worker in self.workers:
+            if worker.writer is not None:
+                worker.writer.close()
+            if worker.reader_task is not None:
+                worker.reader_task.cancel()
+            if worker.process is not None:
+                worker.process.terminate()
+        for worker in self.workers:
+            if worker.process is not None:
+                await asyncio.to_thread(worker.process.join, 5)
+            if os.path.exists(worker.path):
+                os.unlink(worker.path)
+            self._retire(worker)
+        self.workers = []
+
+resolver_pool = ResolverPool(RESOLVER_WORKERS)
+
+async def resolve_url(url: str, session: Optional[aiohttp.ClientSession] = None) -> Dict:
+    """استخراج الرابط عبر عمال العمليات إن وُجدوا وإلا داخل العملية الحالية"""
+    if resolver_pool.started:
+        with metrics.stage('rpc', url):
+            return await resolver_pool.resolve(url, remaining_budget())
+    return await resolve_episode(url, session or http_client.session, remaining_budget())
+
+# ----------------- كاش الروابط المستخرجة -----------------
+class ResolutionCache:
+    """كاش LRU بمدة صلاحية مع دمج الطلبات المتزامنة لنفس المفتاح"""
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.stats = {'hits': 0, 'misses': 0, 'coalesced': 0}
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+    
+    def snapshot(self, limit: int) -> List[Tuple[str, float, Any]]:
+        """أحدث المدخلات الصالحة (المفتاح، المدة المتبقية، القيمة) من الأقدم استخداماً للأحدث"""
+        now = time.monotonic()
+        entries = [(key, expires - now, value) for key, (expires, value) in self._entries.items() if expires > now]
+        return entries[-limit:]
+    
+    def inflight(self, key: str) -> Optional[asyncio.Future]:
+        """الاستخراج الجاري لنفس المفتاح إن وُجد"""
+        return self._inflight.get(key)
+    
+    def discard(self, key: str):
+        self._entries.pop(key, None)
+    
+    def put(self, key: str, value: Any, ttl: Optional[float] = None):
+        self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+    
+    async def get_or_resolve(self, key: str, resolver: Callable[[], Awaitable[Any]],
+                             cacheable: Callable[[Any], bool] = lambda value: True,
+                             ttl_of: Optional[Callable[[Any], float]] = None) -> Any:
+        value = self.get(key)
+        if value is not None:
+            self.stats['hits'] += 1
+            return value
+        
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.stats['coalesced'] += 1
+            return await asyncio.shield(inflight)
+        
+        self.stats['misses'] += 1
+        future = asyncio.ensure_future(resolver())
+        self._inflight[key] = future
+        
+        def on_done(fut: asyncio.Future):
+            self._inflight.pop(key, None)
+            if not fut.cancelled() and fut.exception() is None and cacheable(fut.result()):
+                self.put(key, fut.result(), ttl_of(fut.result()) if ttl_of else None)
+        
+        future.add_done_callback(on_done)
+        # حماية المهمة المشتركة من الإلغاء إذا ألغى أحد المنتظرين طلبه
+        return await asyncio.shield(future)
+
+resolution_cache = ResolutionCache(RESOLUTION_CACHE_SIZE, RESOLUTION_CACHE_TTL)
+redirect_cache = ResolutionCache(REDIRECT_CACHE_SIZE, REDIRECT_DEFAULT_TTL)
+probe_cache = ResolutionCache(PROBE_CACHE_SIZE, PROBE_CACHE_TTL)
+
+async def resolve_cached(url: str, session: aiohttp.ClientSession) -> Tuple[bool, str, List[List[InlineKeyboardButton]]]:
+    """معالجة الرابط عبر الكاش (الطلبات الفاشلة لا تُخزن، والروابط المعطلة تُعيد الاستخراج)"""
+    key = canonical_episode_url(url)
+    await cache_snapshot.wait_loaded()
+    prefetcher.note_request(key)
+    for attempt in range(2):
+        result = await resolution_cache.get_or_resolve(
+            key,
+            lambda: resolve_url(url, session),
+            cacheable=lambda result: result['success'],
+        )
+        if not result['success'] or await links_alive(result['qualities']):
+            break
+        logger.info(f"Cached links for {key} are dead, resolving again")
+        resolution_cache.discard(key)
+    return resolution_to_reply(result)
+
+# ----------------- لقطة الكاش على القرص -----------------
+SNAPSHOT_MAGIC = b'ASCACHE1'
+# رقم الكاش، وقت الانتهاء (ساعة النظام)، طول المفتاح، طول القيمة
+_SNAPSHOT_ENTRY = struct.Struct('<BdII')
+
+def write_cache_snapshot(path: str, caches_entries: List[List[Tuple[str, float, Any]]]):
+    """كتابة اللقطة في ملف مؤقت فريد ثم استبداله دفعة واحدة"""
+    now = time.time()
+    # اسم فريد حتى لا تكتب عدة نسخ في نفس الملف المؤقت
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp',
+                                    dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(SNAPSHOT_MAGIC)
+            for index, entries in enumerate(caches_entries):
+                for key, ttl, value in entries:
+                    key_bytes = key.encode()
+                    value_bytes = json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode()
+                    f.write(_SNAPSHOT_ENTRY.pack(index, now + ttl, len(key_bytes), len(value_bytes)))
+                    f.write(key_bytes)
+                    f.write(value_bytes)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def read_cache_snapshot(path: str) -> List[Tuple[int, float, str, Any]]:
+    """قراءة اللقطة عبر mmap (المدخلات المنتهية تُتخطى دون فك ترميزها)"""
+    entries = []
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size <= len(SNAPSHOT_MAGIC):
+            return entries
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+                raise ValueError(f"Unknown cache snapshot format in {path}")
+            now = time.time()
+            offset = len(SNAPSHOT_MAGIC)
+            while offset + _SNAPSHOT_ENTRY.size <= len(data):
+                index, expires, key_size, value_size = _SNAPSHOT_ENTRY.unpack_from(data, offset)
+                offset += _SNAPSHOT_ENTRY.size
+                end = offset + key_size + value_size
+                if end > len(data):
+                    break
+                if expires > now:
+                    key = data[offset:offset + key_size].decode()
+                    entries.append((index, expires, key, json.loads(data[offset + key_size:end])))
+                offset = end
+    return entries
+
+class CacheSnapshot:
+    """حفظ المدخلات الساخنة من كاش الروابط والتحويلات واستعادتها بعد إعادة التشغيل"""
+    def __init__(self, path: str, caches: List[ResolutionCache], max_entries: int = CACHE_SNAPSHOT_MAX_ENTRIES):
+        self.path = path
+        self.caches = caches
+        self.max_entries = max_entries
+        self._loaded = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self.stats = {'loaded': 0, 'saved': 0}
+    
+    async def start(self):
+        if not self.path:
+            self._loaded.set()
+            return
+        self._tasks = [asyncio.create_task(self._load()), asyncio.create_task(self._save_loop())]
+    
+    async def _load(self):
+        started = time.perf_counter()
+        try:
+            entries = await asyncio.to_thread(read_cache_snapshot, self.path)
+        except FileNotFoundError:
+            entries = []
+        except Exception as e:
+            logger.warning(f"Could not load cache snapshot: {e}")
+            entries = []
+        
+        now = time.time()
+        for index, expires, key, value in entries:
+            cache = self.caches[index]
+            # ما حُل بعد بدء التشغيل أحدث من اللقطة
+            if cache.get(key) is None:
+                cache.put(key, value, expires - now)
+        self.stats['loaded'] = len(entries)
+        self._loaded.set()
+        if entries:
+            logger.info(f"Restored {len(entries)} cache entries in {(time.perf_counter() - started) * 1000:.1f}ms")
+    
+    async def wait_loaded(self, timeout: float = CACHE_SNAPSHOT_LOAD_WAIT):
+        """انتظار قصير لاكتمال الاستعادة حتى يُخدم أول طلب من الكاش"""
+        if self._loaded.is_set() or not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._loaded.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+    
+    async def save(self):
+        entries = [cache.snapshot(self.max_entries) for cache in self.caches]
+        await asyncio.to_thread(write_cache_snapshot, self.path, entries)
+        self.stats['saved'] = sum(len(cache_entries) for cache_entries in entries)
+    
+    async def _save_loop(self):
+        # الحفظ الدوري يغطي حالات التوقف المفاجئ
+        while True:
+            await asyncio.sleep(CACHE_SNAPSHOT_INTERVAL)
+            try:
+                await self.save()
+            except Exception as e:
+                logger.warning(f"Could not save cache snapshot: {e}")
+    
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # لا نستبدل اللقطة بكاش لم تكتمل استعادته
+        if self.path and self._loaded.is_set():
+            try:
+                await self.save()
+            except Exception as e:
+                logger.warning(f"Could not save cache snapshot: {e}")
+
+cache_snapshot = CacheSnapshot(CACHE_SNAPSHOT_PATH.format(instance=INSTANCE_ID), [resolution_cache, redirect_cache])
+
+# ----------------- معالجة نطاق حلقات -----------------
+def parse_episode_range(spec: Optional[str]) -> Optional[Tuple[int, int]]:
+    """تحليل نطاق الحلقات مثل 1-30 أو 5 (بحد أقصى MAX_EPISODES_PER_RUN)"""
+    if not spec:
+        return 1, MAX_EPISODES_PER_RUN
+    match = re.fullmatch(r'(\d+)(?:\s*-\s*(\d+))?', spec.strip())
+    if not match:
+        return None
+    first = int(match.group(1))
+    last = int(match.group(2)) if match.group(2) else first + MAX_EPISODES_PER_RUN - 1
+    if first < 1 or last < first:
+        return None
+    return first, min(last, first + MAX_EPISODES_PER_RUN - 1)
+
+async def resolve_episode_range(build_url: Callable[[int], Optional[str]], first: int, last: int,
+                                on_result: Callable[[int, str, Tuple], Awaitable[None]]) -> Optional[int]:
+    """معالجة نطاق حلقات عبر مجموعة عمال محدودة مع التوقف بعد حلقات غير موجودة متتالية
+    
+    تُستدعى من داخل مهمة مجدولة: العامل الأول يستخدم مكان المهمة نفسها، وبقية العمال
+    يستعيرون مكاناً من المجدول لكل حلقة حتى لا يتجاوز النطاق حد العمال العام.
+    """
+    next_episode = first
+    stop_at = last
+    not_found = set()
+    stopped_at = None
+    waiting: set = set()
+    
+    async def resolve_next() -> Tuple[int, Optional[str], Optional[Tuple]]:
+        nonlocal next_episode
+        episode = next_episode
+        next_episode += 1
+        url = build_url(episode)
+        return episode, url, await resolve_cached(url, http_client.session) if url else None
+    
+    async def borrowed_resolve() -> Optional[Tuple[int, Optional[str], Optional[Tuple]]]:
+        task = asyncio.current_task()
+        waiting.add(task)
+        try:
+            await scheduler.acquire_slot()
+        except asyncio.CancelledError:
+            # أُلغي الانتظار لأن العامل الأول أنهى النطاق
+            if next_episode > stop_at:
+                return None
+            raise
+        finally:
+            waiting.discard(task)
+        try:
+            return await resolve_next() if next_episode <= stop_at else None
+        finally:
+            scheduler.release_slot()
+    
+    async def worker(borrow: bool):
+        nonlocal stop_at, stopped_at
+        while next_episode <= stop_at:
+            resolved = await borrowed_resolve() if borrow else await resolve_next()
+            if resolved is None:
+                return
+            episode, url, result = resolved
+            if not url:
+                continue
+            
+            if not result[0] and is_episode_not_found(result[1]):
+                not_found.add(episode)
+                low = high = episode
+                while low - 1 in not_found:
+                    low -= 1
+                while high + 1 in not_found:
+                    high += 1
+                # التوقف عن الفحص بعد سلسلة من الحلقات غير الموجودة
+                if high - low + 1 >= RANGE_NOT_FOUND_STREAK and low - 1 < stop_at:
+                    stop_at = low - 1
+                    stopped_at = low
+            
+            await on_result(episode, url, result)
+        
+        if not borrow:
+            # انتهى النطاق: من ينتظر مكاناً من المجدول لم يعد له عمل
+            for task in list(waiting):
+                task.cancel()
+    
+    workers = [asyncio.create_task(worker(borrow=index > 0)) for index in range(min(RANGE_WORKERS, last - first + 1))]
+    try:
+        await asyncio.gather(*workers)
+    finally:
+        # فشل أحد العمال (أو إلغاء المهمة) يوقف البقية بدلاً من تركهم يرسلون
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+    return stopped_at
 
-# ----------------- إعدادات التسجيل (Logging) -----------------
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
-logger = logging.getLogger(__name__)
+async def reply_with_retry(message, text: str, **kwargs) -> bool:
+    """إرسال رد مع انتظار RetryAfter وإعادة المحاولة عند أخطاء الشبكة المؤقتة"""
+    for attempt in range(RANGE_SEND_RETRIES):
+        try:
+            await message.reply_text(text, **kwargs)
+            return True
+        except RetryAfter as e:
+            logger.warning(f"Flood limit reached, retrying in {e.retry_after}s")
+            await asyncio.sleep(e.retry_after)
+        except NetworkError as e:
+            logger.warning(f"Reply failed ({e}), attempt {attempt + 1}")
+            await asyncio.sleep(RANGE_SEND_INTERVAL * 2 ** attempt)
+        except TelegramError as e:
+            logger.warning(f"Could not send reply: {e}")
+            return False
+    return False
 
-# ----------------- إعدادات البوت -----------------
-TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN", "YOUR_BOT_TOKEN_HERE")
-ADMIN_IDS = json.loads(os.environ.get("ADMIN_IDS", "[]"))
-MAX_EPISODES_PER_RUN = 50
-REQUEST_TIMEOUT = 30
-USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+# ----------------- جدولة المهام -----------------
+class QueueFull(Exception):
+    """قائمة الانتظار ممتلئة (للجميع أو لهذا المستخدم)"""
+    def __init__(self, per_user: bool = False):
+        super().__init__("per-user queue is full" if per_user else "queue is full")
+        self.per_user = per_user
 
-# ----------------- دوال مساعدة -----------------
-def extract_base_url(url: str) -> str:
-    """استخراج الرابط الأساسي"""
-    parsed_url = urlparse(url)
-    return f"{parsed_url.scheme}://{parsed_url.netloc}"
+class Job:
+    """مهمة في قائمة الانتظار"""
+    __slots__ = ('user_id', 'run', 'on_position', 'future', 'enqueued_at', 'last_position', 'notified_at')
+    
+    def __init__(self, user_id: int, run: Callable[[], Awaitable[Any]],
+                 on_position: Optional[Callable[[int], Awaitable[None]]] = None):
+        self.user_id = user_id
+        self.run = run
+        self.on_position = on_position
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.monotonic()
+        self.last_position = 0
+        self.notified_at = 0.0
 
-def extract_title_from_url(url: str) -> str:
-    """استخراج العنوان من الرابط"""
-    parsed_url = urlparse(url)
-    path = unquote(parsed_url.path)
-    path_parts = path.strip('/').split('-')
-    title = ' '.join(path_parts).replace('.html', '').title()
+class JobScheduler:
+    """مجموعة عمال عامة مع طوابير لكل مستخدم تُخدم بالتناوب (Round-Robin)"""
+    def __init__(self, workers: int, max_queue: int, max_per_user: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_per_user = max_per_user
+        # ترتيب المستخدمين هو ترتيب الخدمة: الأول يُخدم أولاً ثم ينتقل للنهاية
+        self._queues: "OrderedDict[int, deque]" = OrderedDict()
+        self._depth = 0
+        self._ready: Optional[asyncio.Semaphore] = None
+        # كل مهمة جارية (بما فيها ما تستعيره مهام النطاق عبر acquire_slot) تشغل مكاناً واحداً
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._tasks: List[asyncio.Task] = []
+        self._background: set = set()
+        self.active = 0
+        self.stats = {'submitted': 0, 'completed': 0, 'rejected': 0, 'background': 0, 'borrowed': 0}
     
-    if title.startswith("مسلسل"):
-        words = title.split()
-        new_title = []
-        for word in words:
-            new_title.append(word)
-            if any(char.isdigit() for char in word):
-                break
-        title = ' '.join(new_title)
+    @property
+    def depth(self) -> int:
+        return self._depth
     
-    return title
-
-async def follow_redirect(url: str, session: aiohttp.ClientSession, max_redirects: int = 5) -> Optional[str]:
-    """تتبع عمليات إعادة التوجيه"""
-    redirect_count = 0
-    current_url = url
+    @property
+    def load(self) -> float:
+        """نسبة الطلبات الجارية والمنتظرة إلى عدد العمال"""
+        return (self.active + self._depth) / self.workers
+    
+    @property
+    def background_active(self) -> int:
+        return len(self._background)
+    
+    def start(self):
+        if self._tasks:
+            return
+        self._ready = asyncio.Semaphore(0)
+        self._slots = asyncio.Semaphore(self.workers)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+    
+    async def acquire_slot(self):
+        """مكان إضافي لمهمة جارية تريد التوازي (ينتظر دوره مع بقية المهام في حد العمال نفسه)"""
+        self.start()
+        await self._slots.acquire()
+        self.active += 1
+        self.stats['borrowed'] += 1
+    
+    def release_slot(self):
+        self.active -= 1
+        self._slots.release()
+    
+    async def close(self, timeout: float = 0):
+        """إيقاف العمال (مع انتظار المهام الجارية حتى timeout)"""
+        if timeout:
+            deadline = time.monotonic() + timeout
+            while (self._depth or self.active) and time.monotonic() < deadline:
+                await asyncio.sleep(0.1)
+        for task in self._tasks + list(self._background):
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._background, return_exceptions=True)
+        self._tasks = []
+        self._background.clear()
+    
+    def submit(self, user_id: int, run: Callable[[], Awaitable[Any]],
+               on_position: Optional[Callable[[int], Awaitable[None]]] = None) -> Job:
+        """إضافة مهمة لطابور المستخدم (QueueFull عند امتلاء القائمة)"""
+        self.start()
+        queue = self._queues.get(user_id)
+        if self._depth >= self.max_queue or (queue is not None and len(queue) >= self.max_per_user):
+            self.stats['rejected'] += 1
+            raise QueueFull(per_user=self._depth < self.max_queue)
+        
+        job = Job(user_id, run, on_position)
+        if queue is None:
+            queue = self._queues[user_id] = deque()
+        queue.append(job)
+        self._depth += 1
+        self.stats['submitted'] += 1
+        job.last_position = self.position(job)
+        self._ready.release()
+        return job
+    
+    def submit_background(self, run: Callable[[], Awaitable[Any]], max_inflight: int, max_load: float) -> bool:
+        """مهمة منخفضة الأولوية خارج عمال الطلبات: تُقبل فقط عندما يكون الحمل منخفضاً"""
+        if len(self._background) >= max_inflight or self.load >= max_load:
+            return False
+        
+        async def run_background():
+            try:
+                await run()
+            except Exception as e:
+                logger.warning(f"Background job failed: {e}")
+        
+        task = asyncio.create_task(run_background())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        self.stats['background'] += 1
+        return True
+    
+    def position(self, job: Job) -> int:
+        """ترتيب المهمة في الخدمة بالتناوب (1 = التالية)"""
+        queue = self._queues.get(job.user_id)
+        if not queue or job not in queue:
+            return 0
+        k = queue.index(job)
+        ahead = 0
+        before = True
+        for user_id, user_queue in self._queues.items():
+            if user_id == job.user_id:
+                before = False
+                ahead += k
+                continue
+            # كل مستخدم يُخدم مرة في كل جولة، وفي جولة المهمة نفسها يُخدم من قبلها فقط
+            ahead += min(len(user_queue), k + 1 if before else k)
+        return ahead + 1
+    
+    def _next_job(self) -> Job:
+        user_id, queue = next(iter(self._queues.items()))
+        job = queue.popleft()
+        if queue:
+            self._queues.move_to_end(user_id)
+        else:
+            del self._queues[user_id]
+        self._depth -= 1
+        return job
     
-    while redirect_count < max_redirects:
+    def _notify_positions(self):
+        now = time.monotonic()
+        for queue in self._queues.values():
+            for job in queue:
+                if job.on_position is None:
+                    continue
+                position = self.position(job)
+                if position != job.last_position and now - job.notified_at >= QUEUE_POSITION_UPDATE_INTERVAL:
+                    job.last_position = position
+                    job.notified_at = now
+                    asyncio.create_task(self._safe_notify(job, position))
+    
+    @staticmethod
+    async def _safe_notify(job: Job, position: int):
         try:
-            async with session.get(current_url, allow_redirects=False, timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)) as response:
-                if response.status in (301, 302, 303, 307, 308) and 'location' in response.headers:
-                    redirect_count += 1
-                    current_url = response.headers['location']
-                    if not current_url.startswith(('http://', 'https://')):
-                        base = extract_base_url(url)
-                        current_url = base + current_url
-                else:
-                    return str(response.url)
+            await job.on_position(position)
         except Exception as e:
-            logger.error(f"Error following redirect: {e}")
-            return None
+            logger.debug(f"Queue position update failed: {e}")
     
-    return current_url
+    async def _worker(self):
+        while True:
+            await self._ready.acquire()
+            try:
+                await self._slots.acquire()
+            except asyncio.CancelledError:
+                self._ready.release()
+                raise
+            job = self._next_job()
+            metrics.observe('queue', '', time.monotonic() - job.enqueued_at)
+            self._notify_positions()
+            self.active += 1
+            try:
+                job.future.set_result(await job.run())
+            except asyncio.CancelledError:
+                job.future.cancel()
+                raise
+            except Exception as e:
+                logger.error(f"Job for user {job.user_id} failed: {e}")
+                job.future.set_exception(e)
+                job.future.exception()
+            finally:
+                self.active -= 1
+                self.stats['completed'] += 1
+                self._slots.release()
 
-def find_last_numeric_segment_in_path(path_unquoted: str) -> Tuple[Optional[int], Optional[str]]:
-    """إيجاد الجزء الرقمي الأخير في المسار"""
-    parts = path_unquoted.strip('/').split('-')
-    for i in range(len(parts)-1, -1, -1):
-        if re.fullmatch(r'\d+', parts[i]):
-            return i, parts[i]
-    return None, None
+scheduler = JobScheduler(SCHEDULER_WORKERS, SCHEDULER_MAX_QUEUE, SCHEDULER_MAX_PER_USER)
 
-def build_episode_url_from_any(url: str, episode_number: int) -> Optional[str]:
-    """بناء رابط الحلقة"""
-    p = urlparse(url)
-    path_unquoted = unquote(p.path)
-    idx, num = find_last_numeric_segment_in_path(path_unquoted)
+# ----------------- الجلب المسبق للحلقة التالية -----------------
+class Prefetcher:
+    """جلب الحلقة التالية مسبقاً إلى الكاش بميزانية تتراجع مع ارتفاع الحمل"""
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self.tokens = per_minute
+        self._refilled = time.monotonic()
+        # الحلقات غير الموجودة (نهاية المسلسل) لا يُعاد جلبها قبل انتهاء المدة
+        self.misses = ResolutionCache(RESOLUTION_CACHE_SIZE, PREFETCH_MISS_TTL)
+        self._prefetched: "OrderedDict[str, None]" = OrderedDict()
+        self.stats = {'issued': 0, 'used': 0, 'skipped_load': 0, 'skipped_budget': 0}
     
-    if idx is None:
-        return None
+    def _take_token(self) -> bool:
+        now = time.monotonic()
+        # معدل التعبئة ينخفض خطياً مع الحمل ويتوقف عند PREFETCH_MAX_LOAD
+        rate = self.per_minute / 60 * max(0.0, 1 - scheduler.load / PREFETCH_MAX_LOAD)
+        self.tokens = min(self.per_minute, self.tokens + (now - self._refilled) * rate)
+        self._refilled = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
     
-    parts = path_unquoted.strip('/').split('-')[:idx+1]
-    parts[-1] = str(episode_number)
-    new_path = '/' + '-'.join(parts)
-    quoted_path = quote(new_path, safe="/%")
-    new_parsed = (p.scheme, p.netloc, quoted_path, '', '', '')
-    return urlunparse(new_parsed)
+    def note_request(self, key: str):
+        """تسجيل طلب مستخدم لحساب فائدة الجلب المسبق"""
+        if key in self._prefetched:
+            del self._prefetched[key]
+            self.stats['used'] += 1
+    
+    def maybe_prefetch(self, url: str) -> bool:
+        """جدولة جلب الحلقة التالية لرابط حلقة ناجحة"""
+        episode_number, build_url = extract_episode_and_base(url)
+        next_url = build_url(episode_number + 1) if build_url else None
+        if not PREFETCH_NEXT or not next_url:
+            return False
+        key = canonical_episode_url(next_url)
+        if resolution_cache.get(key) is not None or self.misses.get(key) is not None or key in self._prefetched:
+            return False
+        if not self._take_token():
+            self.stats['skipped_budget'] += 1
+            return False
+        
+        async def run():
+            result = await resolution_cache.get_or_resolve(
+                key,
+                lambda: resolve_url(next_url),
+                cacheable=lambda result: result['success'],
+            )
+            if not result['success']:
+                # الحلقة غير الموجودة لن تظهر قريباً، أما الأعطال العابرة فتُجرب في المرة القادمة
+                if is_episode_not_found(result['title']):
+                    self.misses.put(key, True)
+                self._prefetched.pop(key, None)
+        
+        if not scheduler.submit_background(run, PREFETCH_MAX_INFLIGHT, PREFETCH_MAX_LOAD):
+            self.tokens += 1
+            self.stats['skipped_load'] += 1
+            return False
+        self._prefetched[key] = None
+        while len(self._prefetched) > RESOLUTION_CACHE_SIZE:
+            self._prefetched.popitem(last=False)
+        self.stats['issued'] += 1
+        return True
 
-def extract_episode_and_base(url: str) -> Tuple[Optional[int], Optional[callable]]:
-    """استخراج رقم الحلقة ودالة البناء"""
-    p = urlparse(url)
-    path_unquoted = unquote(p.path)
-    idx, num = find_last_numeric_segment_in_path(path_unquoted)
+prefetcher = Prefetcher(PREFETCH_PER_MINUTE)
+inline_stats = {'answered': 0, 'placeholders': 0}
+
+# ----------------- متابعة الحلقات الجديدة -----------------
+def series_key(url: str) -> Optional[str]:
+    """مفتاح المسلسل: رابط الحلقة الموحد بدون رقم الحلقة"""
+    episode_number, build_url = extract_episode_and_base(url)
+    if episode_number is None:
+        return None
+    # المسار حتى رقم الحلقة فقط ثم حذف الرقم
+    return canonical_episode_url(build_url(episode_number)).rsplit('-', 1)[0]
+
+def series_token(url: str) -> Optional[str]:
+    """معرّف قصير للمسلسل يوضع في بيانات الأزرار (حدها 64 بايت)"""
+    key = series_key(url)
+    return hashlib.sha1(key.encode()).hexdigest()[:10] if key else None
+
+def next_check_time(interval: float = WATCH_INTERVAL) -> float:
+    """موعد الفحص التالي مع تفاوت عشوائي حتى لا تتزامن طلبات المسلسلات"""
+    return time.time() + interval * random.uniform(1 - WATCH_JITTER, 1 + WATCH_JITTER)
+
+class WatchPoller:
+    """فحص دوري لكل مسلسل متابَع بطلب شرطي واحد مهما كان عدد المشتركين"""
+    def __init__(self):
+        self.store: Optional[WatchStore] = None
+        self.bot = None
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {'checks': 0, 'not_modified': 0, 'released': 0, 'notified': 0}
     
-    if idx is None or num is None:
-        return None, None
+    async def start(self, bot, path: str = SESSION_DB_PATH):
+        if not path or self.store is not None:
+            return
+        self.bot = bot
+        self.store = await asyncio.to_thread(WatchStore, path)
+        # عند تشغيل عدة نسخ تفحص النسخة 0 فقط حتى لا تتكرر الطلبات والتنبيهات
+        if INSTANCE_ID == 0:
+            self._task = asyncio.create_task(self._loop())
     
-    return int(num), lambda ep: build_episode_url_from_any(url, ep)
-
-# ----------------- دوال الاستخراج الرئيسية -----------------
-async def get_download_info(server_href: str, referer: str) -> Optional[Dict]:
-    """استخراج معلومات التحميل من رابط السيرفر"""
-    try:
-        timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+    
+    async def _loop(self):
+        semaphore = asyncio.Semaphore(WATCH_CONCURRENCY)
         
-        async with aiohttp.ClientSession(
-            headers={"User-Agent": USER_AGENT, "Referer": referer},
-            timeout=timeout
-        ) as session:
-            
-            # تتبع إعادة التوجيه
-            redirected = await follow_redirect(server_href, session)
-            if not redirected:
-                return None
-            
-            # البحث عن رابط ?r=
-            r_link = None
-            if '?r=' in redirected:
-                r_link = redirected
-            else:
-                async with session.get(redirected) as response:
-                    text = await response.text()
-                    match = re.search(r'(https?://[^"\'>\s]+/category/downloadz/\?r=\d+[^"\'>\s]*)', text)
-                    if match:
-                        r_link = match.group(1)
-                    elif '?r=' in str(response.url):
-                        r_link = str(response.url)
-            
-            if not r_link:
-                return None
-            
-            # تحليل صفحة التحميل
-            async with session.get(r_link) as response:
-                text = await response.text()
-                soup = BeautifulSoup(text, 'html.parser')
-                
-                # البحث عن زر التحميل
-                btn_tag = soup.find('a', id='btn') or soup.select_one('a.downloadbtn')
-                final_asd_url = None
-                
-                if btn_tag and btn_tag.get('href'):
-                    candidate = btn_tag.get('href')
-                    if candidate.startswith('/'):
-                        candidate = extract_base_url(r_link) + candidate
-                    final_asd_url = candidate
-                else:
-                    # محاولة إنشاء الرابط ديناميكياً
-                    dynamic_param_pattern = r'([?&][a-zA-Z0-9_]+\d*=[^"&\']+)'
-                    qs_matches = re.findall(dynamic_param_pattern, text)
-                    params = []
-                    for q in qs_matches:
-                        normalized_param = q.lstrip('?&')
-                        if normalized_param.lower().startswith('r='):
-                            continue
-                        param_name = normalized_param.split('=', 1)[0]
-                        if not any(p.startswith(param_name + '=') for p in params):
-                            params.append(normalized_param)
-                    
-                    if params:
-                        sep = '&' if '?' in r_link else '?'
-                        final_asd_url = r_link + sep + '&'.join(params)
-                
-                if not final_asd_url:
-                    final_asd_url = r_link
-                
-                # الحصول على الرابط النهائي
-                async with session.get(final_asd_url) as final_resp:
-                    final_text = await final_resp.text()
-                    final_soup = BeautifulSoup(final_text, 'html.parser')
-                    
-                    # البحث عن رابط MP4
-                    final_tag = (final_soup.find('a', id='btn') or 
-                                final_soup.find('a', class_='downloadbtn') or 
-                                final_soup.find('a', href=re.compile(r'\.mp4')))
-                    
-                    if not final_tag:
-                        return None
-                    
-                    file_link = final_tag.get('href')
-                    if file_link and file_link.startswith('/'):
-                        file_link = extract_base_url(final_asd_url) + file_link
-                    
-                    # استخراج اسم الملف وحجمه
-                    file_name = None
-                    file_size = None
-                    
-                    name_span = final_soup.select_one('.TitleCenteral h3 span')
-                    if name_span:
-                        file_name = name_span.get_text(strip=True)
-                    
-                    size_span = final_soup.select_one('.TitleCenteral h3:nth-of-type(2) span')
-                    if size_span:
-                        file_size = size_span.get_text(strip=True)
-                    
-                    if not file_size:
-                        h3 = final_soup.find('h3')
-                        if h3:
-                            msize = re.search(r'الحجم[:\s\-–]*([\d\.,]+\s*(?:MB|GB))', h3.get_text())
-                            if msize:
-                                file_size = msize.group(1)
-                    
-                    if not file_name:
-                        file_name = os.path.basename(file_link) if file_link else "unknown"
-                    
-                    return {
-                        'direct_link': file_link.replace(" ", ".") if file_link else None,
-                        'file_name': file_name,
-                        'file_size': file_size or "Unknown"
-                    }
+        async def check(row):
+            async with semaphore:
+                try:
+                    await self.check_series(*row)
+                except Exception as e:
+                    logger.error(f"Watch check failed for {row[0]}: {e}")
+                    await asyncio.to_thread(self.store.postpone, row[0], next_check_time(WATCH_RETRY_INTERVAL))
+        
+        while True:
+            rows = await asyncio.to_thread(self.store.due, time.time(), WATCH_BATCH)
+            await asyncio.gather(*(check(row) for row in rows))
+            if len(rows) < WATCH_BATCH:
+                await asyncio.sleep(WATCH_TICK)
     
-    except Exception as e:
-        logger.error(f"Error in get_download_info: {e}")
-        return None
-
-async def process_arabseed_url(url: str, session: aiohttp.ClientSession) -> Tuple[bool, str, List[List[InlineKeyboardButton]]]:
-    """معالجة رابط عرب سيد"""
-    try:
-        # فحص الرابط
-        if not url.startswith(('http://', 'https://')):
-            return False, "❌ رابط غير صالح!", []
+    async def check_series(self, series: str, next_url: str, episode: int, title: str,
+                           etag: Optional[str], last_modified: Optional[str]):
+        """فحص الحلقة المنتظرة بطلب شرطي وقراءة جزئية، والاستخراج الكامل فقط عند صدورها"""
+        self.stats['checks'] += 1
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
         
-        # تتبع الروابط المختصرة
-        if '/l/' in url or 'reviewrate.net' in url:
-            url = await follow_redirect(url, session) or url
+        with request_deadline(REQUEST_BUDGET):
+            page = await fetch_page(http_client.session, next_url, headers=headers, until=(DOWNLOAD_ANCHOR_RE,),
+                                    abort_on=NOT_FOUND_RE, stage='watch')
+        if page.status == 304:
+            self.stats['not_modified'] += 1
+        released = page.status == 200 and not page.aborted and DOWNLOAD_ANCHOR_RE.search(page.text)
+        if not released:
+            await asyncio.to_thread(self.store.update, series, next_url, episode,
+                                    page.etag or etag, page.last_modified or last_modified, next_check_time())
+            return
         
-        async with session.get(url, timeout=REQUEST_TIMEOUT) as response:
-            if response.status != 200:
-                return False, f"❌ الرابط غير متاح (رمز: {response.status})", []
-            
-            text = await response.text()
-            
-            # التحقق من وجود الصفحة
-            if any(phrase in text.lower() for phrase in ['لم يتم العثور', 'page not found', 'صفحة غير موجودة']):
-                return False, "❌ الحلقة غير موجودة!", []
-            
-            soup = BeautifulSoup(text, 'html.parser')
-            
-            # البحث عن رابط صفحة التحميل
-            download_anchor = soup.find('a', href=re.compile(r'/download/')) or soup.find('a', class_=re.compile(r'download__btn|downloadBTn'))
-            if not download_anchor:
-                return False, "❌ لم أتمكن من العثور على روابط التحميل!", []
-            
-            quality_page_url = download_anchor.get('href')
-            if quality_page_url.startswith('/'):
-                quality_page_url = extract_base_url(url) + quality_page_url
-            
-            # زيارة صفحة الجودات
-            async with session.get(quality_page_url, headers={'Referer': extract_base_url(url)}) as qresp:
-                if qresp.status != 200:
-                    return False, "❌ صفحة الجودات غير متاحة!", []
-                
-                qtext = await qresp.text()
-                qsoup = BeautifulSoup(qtext, 'html.parser')
-                
-                # جمع روابط السيرفرات
-                server_links = qsoup.find_all('a', href=re.compile(r'/l/'))
-                if not server_links:
-                    server_links = qsoup.select('ul.downloads__links__list a')
-                
-                if not server_links:
-                    return False, "❌ لا توجد روابط تحميل متاحة!", []
-                
-                # معالجة كل سيرفر
-                buttons = []
-                seen_qualities = set()
-                
-                for a in server_links:
-                    href = a.get('href')
-                    if not href:
-                        continue
-                    
-                    # تخطي الروابط غير المباشرة
-                    if 'arabseed' not in href and 'عرب سيد' not in a.get_text(" ", strip=True):
-                        continue
-                    
-                    # تحديد الجودة
-                    quality = "Unknown"
-                    parent_with_quality = a.find_parent(attrs={"data-quality": True})
-                    if parent_with_quality:
-                        quality = parent_with_quality.get('data-quality')
-                    else:
-                        ptxt = a.get_text(" ", strip=True)
-                        qmatch = re.search(r'(\d{3,4}p)', ptxt)
-                        if qmatch:
-                            quality = qmatch.group(1)
-                    
-                    if quality in seen_qualities:
-                        continue
-                    seen_qualities.add(quality)
-                    
-                    # استخراج معلومات التحميل
-                    info = await get_download_info(href, extract_base_url(quality_page_url))
-                    if info and info.get('direct_link'):
-                        btn_text = f"📥 {quality} ({info.get('file_size', '?')})"
-                        buttons.append([InlineKeyboardButton(btn_text, url=info['direct_link'])])
-                
-                if not buttons:
-                    return False, "❌ لم أتمكن من استخراج روابط التحميل!", []
-                
-                title = extract_title_from_url(url)
-                return True, title, buttons
+        success, resolved_title, buttons = await resolve_cached(next_url, http_client.session)
+        if not success:
+            # الصفحة موجودة لكن الروابط لم تجهز بعد
+            await asyncio.to_thread(self.store.update, series, next_url, episode, None, None,
+                                    next_check_time(WATCH_RETRY_INTERVAL))
+            return
+        
+        self.stats['released'] += 1
+        _, build_url = extract_episode_and_base(next_url)
+        # قد تصدر عدة حلقات معاً: الحلقة التالية تُفحص بعد فترة قصيرة
+        await asyncio.to_thread(self.store.update, series, build_url(episode + 1), episode + 1, None, None,
+                                next_check_time(WATCH_RETRY_INTERVAL))
+        await self.notify(series, f"🆕 صدرت الحلقة {episode} من {title or resolved_title}!", buttons)
     
-    except asyncio.TimeoutError:
-        return False, "⏰ انتهى الوقت المحدد للطلب!", []
-    except Exception as e:
-        logger.error(f"Error processing URL: {e}\n{traceback.format_exc()}")
-        return False, f"❌ حدث خطأ أثناء المعالجة: {str(e)}", []
+    async def notify(self, series: str, text: str, buttons: List[List[InlineKeyboardButton]]):
+        """إرسال التنبيه لكل المشتركين بمعدل لا يتجاوز حدود Telegram"""
+        keyboard = InlineKeyboardMarkup(buttons)
+        for user_id in await asyncio.to_thread(self.store.watchers, series):
+            try:
+                await self.bot.send_message(user_id, text, reply_markup=keyboard)
+                self.stats['notified'] += 1
+            except Forbidden:
+                # المستخدم حظر البوت
+                await asyncio.to_thread(self.store.remove, user_id)
+            except Exception as e:
+                logger.warning(f"Could not notify user {user_id}: {e}")
+            await asyncio.sleep(WATCH_NOTIFY_DELAY)
+
+watch_poller = WatchPoller()
 
 # ----------------- معالجات Telegram -----------------
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -400,6 +3119,11 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 3. انتظر حتى أعالج الرابط
 4. سأرسل لك روابط التحميل المباشرة
 
+📚 *نطاق حلقات:* /range <رابط الحلقة> 1-30
+⚡ *الوضع التلقائي:* /auto لتجهيز الحلقة التالية مسبقاً
+🔔 *متابعة مسلسل:* /watch <رابط الحلقة> و /unwatch لإلغائها
+🔍 *في أي محادثة:* اكتب معرف البوت ثم رابط الحلقة
+
 ⚠️ *ملاحظات هامة:*
 • البوت يدعم الروابط المباشرة فقط
 • قد لا تعمل بعض الحلقات القديمة
@@ -411,64 +3135,167 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     await update.message.reply_text(help_text, parse_mode='Markdown')
 
+BUSY_MSG = "🚫 البوت مشغول حالياً، حاول مرة أخرى بعد قليل."
+USER_BUSY_MSG = "🚫 لديك عدة طلبات في قائمة الانتظار، انتظر حتى تنتهي."
+
+async def enqueue_job(user_id: int, wait_msg, run: Callable[[], Awaitable[None]]) -> bool:
+    """إضافة مهمة للجدولة مع عرض ترتيب المستخدم في رسالة الانتظار"""
+    processing_text = wait_msg.text
+    queued = False
+    
+    async def on_position(position: int):
+        nonlocal queued
+        queued = True
+        await wait_msg.edit_text(f"⏳ طلبك في قائمة الانتظار (الترتيب: {position})...")
+    
+    async def run_job():
+        if queued:
+            try:
+                await wait_msg.edit_text(processing_text)
+            except Exception as e:
+                logger.debug(f"Could not restore wait message: {e}")
+        await run()
+    
+    try:
+        job = scheduler.submit(user_id, run_job, on_position)
+    except QueueFull as e:
+        await wait_msg.edit_text(USER_BUSY_MSG if e.per_user else BUSY_MSG)
+        return False
+    
+    if job.last_position > scheduler.workers - scheduler.active:
+        await on_position(job.last_position)
+    return True
+
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """معالجة الرسائل النصية"""
     user_id = update.effective_user.id
     message = update.message
     
-    if storage.is_processing(user_id):
-        await message.reply_text("⏳ جاري معالجة طلبك السابق، انتظر قليلاً...")
-        return
-    
     url = message.text.strip()
     
     if not url.startswith(('http://', 'https://')):
         await message.reply_text("❌ هذا ليس رابطاً صالحاً!")
         return
     
-    storage.set_processing(user_id, True)
+    await resolve_and_reply(user_id, url, message)
+
+async def resolve_and_reply(user_id: int, url: str, message):
+    """جدولة استخراج الرابط والرد على الرسالة بالنتيجة"""
+    # إرسال رسالة الانتظار
+    wait_msg = await message.reply_text("⏳ جاري معالجة الرابط، يرجى الانتظار...")
     
-    try:
-        # إرسال رسالة الانتظار
-        wait_msg = await message.reply_text("⏳ جاري معالجة الرابط، يرجى الانتظار...")
-        
-        async with aiohttp.ClientSession(headers={"User-Agent": USER_AGENT}) as session:
-            success, title, buttons = await process_arabseed_url(url, session)
-        
-        if success:
-            response_text = f"""
+    async def run():
+        try:
+            success, title, buttons = await resolve_cached(url, http_client.session)
+            
+            if success:
+                response_text = f"""
 🎬 *{title}*
 
 📥 *روابط التحميل المتاحة:*
 اختر الجودة المناسبة من الأزرار أدناه.
 
 🔔 *ملاحظة:* الروابط مباشرة من سيرفرات عرب سيد
-            """
-            
-            keyboard = InlineKeyboardMarkup(buttons + [
-                [InlineKeyboardButton("🔄 معالجة رابط آخر", callback_data="new_link")],
-                [InlineKeyboardButton("📢 قناة البوت", url="https://t.me/ArabSeed_DL_Bot")]
-            ])
-            
-            await wait_msg.delete()
-            await message.reply_text(response_text, reply_markup=keyboard, parse_mode='Markdown')
-            
-            # حفظ في التاريخ
-            storage.get_session(user_id)['history'].append({
-                'url': url,
-                'title': title,
-                'time': datetime.now().isoformat()
-            })
-        else:
-            await wait_msg.delete()
-            await message.reply_text(f"{title}\n\n⚠️ تأكد من صحة الرابط وحاول مرة أخرى.")
+                """
+                
+                episode_number, _ = extract_episode_and_base(url)
+                token = series_token(url)
+                if episode_number is not None and token:
+                    buttons = buttons + [[InlineKeyboardButton("⏭ الحلقة التالية", callback_data=f"next:{token}:{episode_number + 1}")]]
+                
+                keyboard = InlineKeyboardMarkup(buttons + [
+                    [InlineKeyboardButton("🔄 معالجة رابط آخر", callback_data="new_link")],
+                    [InlineKeyboardButton("📢 قناة البوت", url="https://t.me/ArabSeed_DL_Bot")]
+                ])
+                
+                await wait_msg.delete()
+                await message.reply_text(response_text, reply_markup=keyboard, parse_mode='Markdown')
+                
+                # حفظ في التاريخ
+                session = storage.get_session(user_id)
+                session.episode_number = episode_number
+                storage.add_history(user_id, url, title)
+                
+                # تجهيز الحلقة التالية في الخلفية
+                if session.auto_mode:
+                    prefetcher.maybe_prefetch(url)
+            else:
+                await wait_msg.delete()
+                await message.reply_text(f"{title}\n\n⚠️ تأكد من صحة الرابط وحاول مرة أخرى.")
+        
+        except Exception as e:
+            logger.error(f"Error in resolve_and_reply: {e}")
+            await message.reply_text("❌ حدث خطأ أثناء المعالجة، حاول مرة أخرى.")
     
-    except Exception as e:
-        logger.error(f"Error in handle_message: {e}")
-        await message.reply_text("❌ حدث خطأ أثناء المعالجة، حاول مرة أخرى.")
+    await enqueue_job(user_id, wait_msg, run)
+
+async def range_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """معالجة الأمر /range لاستخراج نطاق حلقات أو موسم كامل"""
+    user_id = update.effective_user.id
+    message = update.message
     
-    finally:
-        storage.set_processing(user_id, False)
+    if not context.args:
+        await message.reply_text("❌ الاستخدام: /range <رابط الحلقة> 1-30")
+        return
+    
+    url = context.args[0].strip()
+    episode_range = parse_episode_range(" ".join(context.args[1:]))
+    _, build_url = extract_episode_and_base(url)
+    
+    if not url.startswith(('http://', 'https://')) or not build_url:
+        await message.reply_text("❌ لم أتمكن من تحديد رقم الحلقة من الرابط!")
+        return
+    if not episode_range:
+        await message.reply_text("❌ نطاق غير صالح! مثال: 1-30")
+        return
+    
+    first, last = episode_range
+    found = []
+    failed = []
+    unsent = []
+    send_lock = asyncio.Lock()
+    last_sent = 0.0
+    
+    async def on_result(episode: int, episode_url: str, result: Tuple):
+        nonlocal last_sent
+        success, title, buttons = result
+        if not success:
+            if not is_episode_not_found(title):
+                failed.append(episode)
+            return
+        
+        # الرسائل تُرسل واحدة تلو الأخرى بفاصل ثابت حتى لا تصطدم بحد الإرسال
+        async with send_lock:
+            await asyncio.sleep(max(0.0, last_sent + RANGE_SEND_INTERVAL - time.monotonic()))
+            sent = await reply_with_retry(
+                message,
+                f"🎬 *{title}*",
+                reply_markup=InlineKeyboardMarkup(buttons),
+                parse_mode='Markdown'
+            )
+            last_sent = time.monotonic()
+        (found if sent else unsent).append(episode)
+    
+    status_msg = await message.reply_text(f"⏳ جاري معالجة الحلقات {first}-{last}...")
+    
+    async def run():
+        try:
+            stopped_at = await resolve_episode_range(build_url, first, last, on_result)
+            
+            summary = f"✅ تمت معالجة {len(found)} حلقة"
+            if failed:
+                summary += f"\n⚠️ تعذر استخراج الحلقات: {', '.join(map(str, sorted(failed)))}"
+            if unsent:
+                summary += f"\n📭 تعذر إرسال الحلقات: {', '.join(map(str, sorted(unsent)))}"
+            if stopped_at:
+                summary += f"\n⏹ توقفت عند الحلقة {stopped_at} (حلقات غير موجودة)"
+            await status_msg.edit_text(summary)
+        
+        except Exception as e:
+            logger.error(f"Error in range_command: {e}")
+            await message.reply_text("❌ حدث خطأ أثناء المعالجة، حاول مرة أخرى.")
+    
+    await enqueue_job(user_id, status_msg, run)
 
 async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """معالجة ضغطات الأزرار"""
@@ -477,6 +3304,153 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     if query.data == "new_link":
         await query.edit_message_text("🔄 أرسل رابط الحلقة الجديدة...")
+    elif query.data.startswith("next:"):
+        # المسلسل يُحدد من رمز الزر في سجل المستخدم وليس من آخر رابط عالجه
+        parts = query.data.split(':')
+        user_id = query.from_user.id
+        source_url = None
+        if len(parts) == 3:
+            history = storage.get_session(user_id).history
+            source_url = next((entry['url'] for entry in reversed(history) if series_token(entry['url']) == parts[1]), None)
+        _, build_url = extract_episode_and_base(source_url or '')
+        next_url = build_url(int(parts[-1])) if build_url else None
+        if not next_url:
+            await query.message.reply_text("❌ أرسل رابط الحلقة مرة أخرى.")
+            return
+        await resolve_and_reply(user_id, next_url, query.message)
+
+async def watch_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """الاشتراك في تنبيه صدور الحلقة التالية (أو عرض الاشتراكات بدون رابط)"""
+    user_id = update.effective_user.id
+    message = update.message
+    if watch_poller.store is None:
+        await message.reply_text("❌ المتابعة غير متاحة حالياً.")
+        return
+    
+    if not context.args:
+        watches = await asyncio.to_thread(watch_poller.store.user_watches, user_id)
+        if not watches:
+            await message.reply_text("📭 لا توجد مسلسلات متابَعة.\nالاستخدام: /watch <رابط الحلقة>")
+            return
+        lines = [f"• {title} (بانتظار الحلقة {episode})" for title, episode in watches]
+        await message.reply_text("🔔 المسلسلات المتابَعة:\n" + "\n".join(lines))
+        return
+    
+    url = context.args[0].strip()
+    episode_number, build_url = extract_episode_and_base(url)
+    if not url.startswith(('http://', 'https://')) or not build_url:
+        await message.reply_text("❌ لم أتمكن من تحديد رقم الحلقة من الرابط!")
+        return
+    
+    title = re.sub(r'\s*الحلقة\s*\d+\s*$', '', extract_title_from_url(url)) or extract_title_from_url(url)
+    added = await asyncio.to_thread(
+        watch_poller.store.add, user_id, series_key(url), build_url(episode_number + 1),
+        episode_number + 1, title, next_check_time(),
+    )
+    if not added:
+        await message.reply_text(f"❌ وصلت للحد الأقصى ({WATCH_MAX_PER_USER} مسلسل). استخدم /unwatch لإلغاء متابعة.")
+        return
+    await message.reply_text(f"🔔 سأرسل لك الروابط فور صدور الحلقة التالية من {title}.")
+
+async def unwatch_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """إلغاء متابعة مسلسل (أو كل المسلسلات بدون رابط)"""
+    user_id = update.effective_user.id
+    if watch_poller.store is None:
+        await update.message.reply_text("❌ المتابعة غير متاحة حالياً.")
+        return
+    series = series_key(context.args[0].strip()) if context.args else None
+    if context.args and series is None:
+        await update.message.reply_text("❌ لم أتمكن من تحديد رقم الحلقة من الرابط!")
+        return
+    removed = await asyncio.to_thread(watch_poller.store.remove, user_id, series)
+    await update.message.reply_text(f"🔕 تم إلغاء متابعة {removed} مسلسل." if removed else "📭 لا توجد متابعة لإلغائها.")
+
+def inline_result_id(*parts: str) -> str:
+    return hashlib.md5('|'.join(parts).encode()).hexdigest()
+
+def inline_articles(key: str, result: Dict) -> List[InlineQueryResultArticle]:
+    """نتائج الاستعلام المضمّن: كل الجودات في نتيجة واحدة ثم نتيجة لكل جودة"""
+    title = result['title']
+    articles = [InlineQueryResultArticle(
+        id=inline_result_id(key),
+        title=f"🎬 {title}",
+        description=" | ".join(f"{info['quality']} ({info.get('file_size', '?')})" for info in result['qualities']),
+        input_message_content=InputTextMessageContent(f"🎬 {title}\n📥 روابط التحميل المتاحة:"),
+        reply_markup=InlineKeyboardMarkup(build_quality_buttons(result['qualities'])),
+    )]
+    for info, buttons in zip(result['qualities'], build_quality_buttons(result['qualities'])):
+        articles.append(InlineQueryResultArticle(
+            id=inline_result_id(key, info['quality']),
+            title=f"📥 {info['quality']} ({info.get('file_size', '?')})",
+            description=title,
+            input_message_content=InputTextMessageContent(f"🎬 {title}\n📥 {info['quality']} ({info.get('file_size', '?')})"),
+            reply_markup=InlineKeyboardMarkup([buttons]),
+        ))
+    return articles
+
+async def inline_query_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """الاستعلام المضمّن @bot <رابط>: إجابة من الكاش أو نتيجة مؤقتة مع استخراج في الخلفية"""
+    query = update.inline_query
+    url = query.query.strip()
+    if not url.startswith(('http://', 'https://')):
+        await query.answer([], cache_time=INLINE_CACHE_TIME, is_personal=False)
+        return
+    
+    key = canonical_episode_url(url)
+    await cache_snapshot.wait_loaded()
+    result = resolution_cache.get(key)
+    if result is None:
+        # الطلبات المتكررة لنفس الرابط (أثناء الكتابة) تنتظر نفس الاستخراج
+        pending = resolution_cache.inflight(key)
+        if pending is None:
+            try:
+                pending = scheduler.submit(query.from_user.id, lambda: resolution_cache.get_or_resolve(
+                    key, lambda: resolve_url(url), cacheable=lambda result: result['success'],
+                )).future
+            except QueueFull:
+                pending = None
+        if pending is not None:
+            done, _ = await asyncio.wait({pending}, timeout=INLINE_WAIT)
+            if done and not pending.cancelled() and pending.exception() is None:
+                result = pending.result()
+    
+    if result is not None and result['success']:
+        inline_stats['answered'] += 1
+        await query.answer(inline_articles(key, result), cache_time=INLINE_CACHE_TIME, is_personal=False)
+        return
+    
+    if result is not None:
+        # فشل نهائي (حلقة غير موجودة أو رابط غير صالح)
+        articles = [InlineQueryResultArticle(
+            id=inline_result_id(key, 'failed'), title=result['title'],
+            input_message_content=InputTextMessageContent(result['title']),
+        )]
+        await query.answer(articles, cache_time=INLINE_FAILURE_CACHE_TIME, is_personal=False)
+        return
+    
+    # نتيجة مؤقتة لا تُخزن لدى Telegram حتى تظهر الروابط عند إعادة فتح القائمة
+    inline_stats['placeholders'] += 1
+    articles = [InlineQueryResultArticle(
+        id=inline_result_id(key, 'pending'),
+        title="⏳ جاري تجهيز الروابط...",
+        description="أعد فتح القائمة بعد ثوانٍ، أو اضغط لإرسال الرابط",
+        input_message_content=InputTextMessageContent(url),
+    )]
+    await query.answer(articles, cache_time=0, is_personal=True)
+
+async def auto_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """تفعيل أو إيقاف الجلب المسبق للحلقة التالية"""
+    user_id = update.effective_user.id
+    session = storage.get_session(user_id)
+    session.auto_mode = not session.auto_mode
+    storage.mark_dirty(user_id)
+    
+    if session.auto_mode:
+        await update.message.reply_text("⚡ تم تفعيل الوضع التلقائي: سأجهز الحلقة التالية مسبقاً بعد كل حلقة.")
+        if session.last_url:
+            prefetcher.maybe_prefetch(session.last_url)
+    else:
+        await update.message.reply_text("⏸ تم إيقاف الوضع التلقائي.")
 
 async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """إحصائيات البوت (للمشرفين فقط)"""
@@ -486,18 +3460,89 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ هذا الأمر للمشرفين فقط!")
         return
     
+    # مع عمال الاستخراج تعيش هذه العدادات داخل العمال وتُجمع هنا
+    http_stats = resolver_pool.combined_stats('http', http_client.stats)
+    redirect_stats = resolver_pool.combined_stats('redirect_cache', redirect_cache.stats)
+    probe_stats = resolver_pool.combined_stats('probe_cache', probe_cache.stats)
+    host_stats = resolver_pool.combined_stats('host_health', host_health.stats)
+    stage_stats = resolver_pool.combined_stats('stage_timeouts', stage_timeouts.stats)
+    rule_stats = resolver_pool.combined_stats('site_rules', site_rules.stats)
+    sizes = resolver_pool.combined_stats('sizes', {'redirect_cache': len(redirect_cache), 'probe_cache': len(probe_cache)})
+    
     stats_text = f"""
 📊 *إحصائيات البوت:*
 
-👥 المستخدمين النشطين: {len(storage.user_sessions)}
-🔄 الطلبات قيد المعالجة: {len(storage.processing_users)}
+👥 المستخدمين النشطين (24 ساعة): {await storage.active_users()} ({len(storage.user_sessions)} في الذاكرة)
+🔄 الطلبات قيد المعالجة: {scheduler.active}/{scheduler.workers}
+📥 قائمة الانتظار: {scheduler.depth}/{scheduler.max_queue} | مرفوضة: {scheduler.stats['rejected']} | انتظار p95: {metrics.by_stage().get('queue', Histogram()).percentile(95):.1f}s
+⚙️ عمليات الاستخراج: {resolver_pool.size if resolver_pool.started else 0} | معلقة: {resolver_pool.outstanding()} | إعادة تشغيل: {resolver_pool.stats['restarts']}
+🔌 إعادة استخدام الاتصالات: {http_stats['connections_reused']}/{http_stats['connections_created'] + http_stats['connections_reused']} ({http_client.reuse_ratio(http_stats):.0%})
+⏳ انتظار المجمع: {http_stats['pool_waits']} مرة (متوسط {http_client.avg_pool_wait_ms(http_stats):.1f}ms)
+🗂 الكاش: {len(resolution_cache)} رابط | إصابة {resolution_cache.stats['hits']} | إخفاق {resolution_cache.stats['misses']} | مدمج {resolution_cache.stats['coalesced']}
+↪️ كاش التحويلات: {sizes['redirect_cache']} | إصابة {redirect_stats['hits']} | إخفاق {redirect_stats['misses']}
+🔎 فحص الروابط: {sizes['probe_cache']} | إصابة {probe_stats['hits']} | إخفاق {probe_stats['misses']}
+💾 لقطة الكاش: استُعيد {cache_snapshot.stats['loaded']} | حُفظ {cache_snapshot.stats['saved']}
+🛡 طلبات احتياطية: {host_stats['hedges']} (فازت {host_stats['hedge_wins']}) | تحويل لمرايا: {host_stats['rewrites']}
+🔁 إعادة المحاولة: {stage_stats['retries']} | نفاد الميزانية: {stage_stats['budget_exhausted']}
+⚡ جلب مسبق: {prefetcher.stats['issued']} (استُخدم {prefetcher.stats['used']}) | مؤجل للحمل: {prefetcher.stats['skipped_load'] + prefetcher.stats['skipped_budget']} | جارٍ: {scheduler.background_active}
+🔔 متابعة: {watch_poller.stats['checks']} فحص (304: {watch_poller.stats['not_modified']}) | صدرت {watch_poller.stats['released']} | تنبيهات {watch_poller.stats['notified']}
+🔍 الاستعلام المضمّن: {inline_stats['answered']} إجابة | {inline_stats['placeholders']} مؤقتة
+🧩 قواعد الاستخراج: `{site_rules.source}` | إعادة تحميل {rule_stats['reloads']} (فشل {rule_stats['reload_errors']})
 ⏰ وقت التشغيل: {time.strftime('%H:%M:%S', time.gmtime(time.time() - start_time))}
 
+⏱ *زمن المراحل (p50/p95/p99):*
+{format_stage_stats()}
+
 📅 آخر تحديث: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
     """
     
     await update.message.reply_text(stats_text, parse_mode='Markdown')
 
+async def rules_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """ترتيب قواعد الاستخراج ومعدل إصابة كل منها (للمشرفين فقط)"""
+    if update.effective_user.id not in ADMIN_IDS:
+        await update.message.reply_text("❌ هذا الأمر للمشرفين فقط!")
+        return
+    
+    rows = site_rules.summary()
+    await update.message.reply_text(
+        f"🧩 *قواعد الاستخراج* (`{site_rules.source}`):\n```\n" + "\n".join(rows) + "\n```",
+        parse_mode='Markdown'
+    )
+
+async def reload_rules_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """إعادة تحميل قواعد الاستخراج من الملف دون إعادة تشغيل (للمشرفين فقط)"""
+    if update.effective_user.id not in ADMIN_IDS:
+        await update.message.reply_text("❌ هذا الأمر للمشرفين فقط!")
+        return
+    
+    try:
+        source = site_rules.reload()
+    except ValueError as e:
+        logger.warning(f"Extraction rules reload failed: {e}")
+        await update.message.reply_text(f"❌ لم يتم تحميل القواعد، ما زالت القواعد السابقة مستخدمة:\n{e}")
+        return
+    
+    count = sum(len(rules) for profile in site_rules.profiles for rules in profile.fields.values())
+    logger.info(f"Extraction rules reloaded from {source} by admin {update.effective_user.id}")
+    await update.message.reply_text(
+        f"✅ تم تحميل {count} قاعدة من {source}.\n"
+        f"عمليات الاستخراج المنفصلة تلتقط التغيير خلال {EXTRACTION_RULES_CHECK_INTERVAL:.0f} ثانية."
+    )
+
+def format_stage_stats() -> str:
+    """جدول النسب المئوية لكل مرحلة ولأبطأ المضيفين"""
+    rows = []
+    for stage, histogram in sorted(metrics.by_stage().items()):
+        rows.append(f"{stage:<10}{histogram.percentile(50) * 1000:>7.0f}{histogram.percentile(95) * 1000:>7.0f}"
+                    f"{histogram.percentile(99) * 1000:>7.0f}ms  n={histogram.count}")
+    hosts = sorted(metrics.by_host().items(), key=lambda item: item[1].count, reverse=True)[:5]
+    if hosts:
+        rows.append("")
+        for host, histogram in hosts:
+            rows.append(f"{host[:24]:<24} p95={histogram.percentile(95) * 1000:.0f}ms n={histogram.count}")
+    return "```\n" + ("\n".join(rows) or "-") + "\n```"
+
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """معالج الأخطاء"""
     logger.error(f"Update {update} caused error {context.error}")
@@ -506,31 +3551,173 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.effective_message.reply_text("❌ حدث خطأ غير متوقع، يرجى المحاولة مرة أخرى.")
 
 # ----------------- التشغيل الرئيسي -----------------
-def main():
-    """الدالة الرئيسية لتشغيل البوت"""
-    global start_time
-    start_time = time.time()
+async def post_init(application: Application):
+    """تهيئة الموارد المشتركة عند بدء التطبيق"""
+    await http_client.start()
+    await cache_snapshot.start()
+    await storage.start()
+    if RESOLVER_WORKERS:
+        await resolver_pool.start()
+    scheduler.start()
+    await watch_poller.start(application.bot)
+    application.bot_data['metrics_runner'] = await start_metrics_server()
+
+async def post_stop(application: Application):
+    """انتظار انتهاء عمليات الاستخراج الجارية قبل إغلاق البوت"""
+    if scheduler.depth or scheduler.active:
+        logger.info(f"Draining {scheduler.active} running and {scheduler.depth} queued job(s)")
+    await scheduler.close(SHUTDOWN_DRAIN_TIMEOUT)
+
+async def post_shutdown(application: Application):
+    """إغلاق الموارد المشتركة عند إيقاف التطبيق"""
+    metrics_runner = application.bot_data.get('metrics_runner')
+    if metrics_runner is not None:
+        await metrics_runner.cleanup()
+    await watch_poller.close()
+    await scheduler.close()
+    await cache_snapshot.close()
+    await resolver_pool.close()
+    await storage.close()
+    await http_client.close()
+
+def allowed_updates_for(application: Application) -> List[str]:
+    """أنواع التحديثات المطلوبة حسب المعالجات المسجلة فعلياً"""
+    from telegram.ext import CallbackQueryHandler, CommandHandler, InlineQueryHandler, MessageHandler
     
-    print("🎬 بدء تشغيل بوت عرب سيد...")
+    # أنواع التحديثات التي يحتاجها كل نوع معالج (لتقليل ما يرسله Telegram)
+    handler_update_types = (
+        (CommandHandler, (Update.MESSAGE,)),
+        (MessageHandler, (Update.MESSAGE,)),
+        (CallbackQueryHandler, (Update.CALLBACK_QUERY,)),
+        (InlineQueryHandler, (Update.INLINE_QUERY,)),
+    )
+    update_types = set()
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            for handler_class, types in handler_update_types:
+                if isinstance(handler, handler_class):
+                    update_types.update(types)
+                    break
+            else:
+                return Update.ALL_TYPES
+    return sorted(update_types)
+
+def build_application() -> Application:
+    """إنشاء التطبيق وتسجيل المعالجات"""
+    from telegram.ext import (
+        Application,
+        CommandHandler,
+        MessageHandler,
+        CallbackQueryHandler,
+        InlineQueryHandler,
+        filters,
+    )
     
-    # إنشاء التطبيق
-    application = Application.builder().token(TOKEN).build()
+    builder = (
+        Application.builder()
+        .token(TOKEN)
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+    )
+    if BOT_API_BASE_URL:
+        builder = builder.base_url(BOT_API_BASE_URL)
+    application = builder.build()
     
     # إضافة المعالجات
     application.add_handler(CommandHandler("start", start_command))
     application.add_handler(CommandHandler("help", help_command))
     application.add_handler(CommandHandler("stats", stats_command))
+    application.add_handler(CommandHandler("rules", rules_command))
+    application.add_handler(CommandHandler("reload_rules", reload_rules_command))
+    application.add_handler(CommandHandler("range", range_command))
+    application.add_handler(CommandHandler("auto", auto_command))
+    application.add_handler(CommandHandler("watch", watch_command))
+    application.add_handler(CommandHandler("unwatch", unwatch_command))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     application.add_handler(CallbackQueryHandler(button_callback))
+    # الإخفاق في الكاش ينتظر حتى INLINE_WAIT، فلا نوقف معالجة بقية التحديثات
+    application.add_handler(InlineQueryHandler(inline_query_handler, block=False))
     
     # إضافة معالج الأخطاء
     application.add_error_handler(error_handler)
+    return application
+
+async def serve_webhook(application: Application, stop_event: Optional[asyncio.Event] = None):
+    """تشغيل البوت بوضع Webhook عبر خادم aiohttp مدمج مع إيقاف تدريجي"""
+    draining = False
+    
+    async def handle_update(request: web.Request) -> web.Response:
+        secret = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+        if not hmac.compare_digest(secret.encode(), WEBHOOK_SECRET.encode()):
+            return web.Response(status=403)
+        # أثناء الإيقاف يعيد Telegram إرسال التحديث لاحقاً (أو لنسخة أخرى)
+        if draining:
+            return web.Response(status=503)
+        try:
+            update = Update.de_json(await request.json(), application.bot)
+        except (ValueError, TypeError, AttributeError, KeyError):
+            # جسم ليس كائن JSON لتحديث صالح
+            return web.Response(status=400)
+        if update is None:
+            return web.Response(status=400)
+        await application.update_queue.put(update)
+        return web.Response()
+    
+    await application.initialize()
+    await application.post_init(application)
+    await application.start()
+    
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, handle_update)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    port = WEBHOOK_PORT if WEBHOOK_REUSE_PORT else WEBHOOK_PORT + INSTANCE_ID
+    await web.TCPSite(runner, WEBHOOK_LISTEN, port, reuse_port=WEBHOOK_REUSE_PORT).start()
+    logger.info(f"Webhook instance {INSTANCE_ID} listening on http://{WEBHOOK_LISTEN}:{port}{WEBHOOK_PATH}")
+    
+    if WEBHOOK_URL and INSTANCE_ID == 0:
+        await application.bot.set_webhook(
+            url=WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=allowed_updates_for(application),
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+        )
+    
+    if stop_event is None:
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop_event.set)
+    
+    try:
+        await stop_event.wait()
+    finally:
+        draining = True
+        await application.stop()
+        await application.post_stop(application)
+        await runner.cleanup()
+        await application.shutdown()
+        await application.post_shutdown(application)
+
+def main():
+    """الدالة الرئيسية لتشغيل البوت"""
+    global start_time
+    start_time = time.time()
+    
+    print("🎬 بدء تشغيل بوت عرب سيد...")
+    
+    # إنشاء التطبيق
+    application = build_application()
     
     # بدء التشغيل
     print("🤖 البوت يعمل الآن! اضغط Ctrl+C لإيقافه.")
     
     # التشغيل المستمر
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if BOT_MODE == "webhook":
+        asyncio.run(serve_webhook(application))
+    else:
+        application.run_polling(allowed_updates=allowed_updates_for(application))
 
 if __name__ == "__main__":
     main()